@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:         benchmark.py
+# Purpose:      Time each stage of making the pages on synthetic data
+#
+# Authors:      Michael Scott Asato Cuthbert
+#
+# Copyright:    Copyright © 2016-23 Michael Scott Asato Cuthbert
+# License:      MIT, see LICENSE file
+#-------------------------------------------------------------------------------
+'''
+Writes synthetic Scorecard files (see syntheticData) to a scratch directory and times
+each stage of the system on them, taking the best of several runs:
+
+    load         readFile of the current year, without the parse cache
+    load_cached  the same, from the parse cache
+    join         linking in the historical year's SAT scores
+    filter       a new FilterEngine answering every score range and income level
+    render       the text of every page, without writing it
+    write        FileGenerator.generateAll, writing every page
+    screwy       screwy_costs.findScrewy
+
+    python benchmark.py --rows 7000 --columns 2000 --save-baseline
+    python benchmark.py --rows 7000 --columns 2000
+
+The second run compares itself to the saved baseline (benchmark_baseline.json) and
+exits with status 1 if any stage got more than --tolerance times slower.  Baselines only
+compare fairly with the same rows, columns, and machine.
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import collegeCosts as cc
+import generateData
+import scorecardYears
+import screwy_costs
+import syntheticData
+
+here = os.path.dirname(os.path.abspath(__file__))
+defaultBaseline = os.path.join(here, 'benchmark_baseline.json')
+
+
+class Benchmark(object):
+    stages = ['load', 'load_cached', 'join', 'filter', 'render', 'write', 'screwy']
+
+    def __init__(self, directory, rows=7000, numColumns=None, repeat=3, seed=1):
+        self.directory = directory
+        self.rows = rows
+        self.numColumns = numColumns
+        self.repeat = repeat
+        self.seed = seed
+        self.fn = os.path.join(directory, 'college_data_%s.csv.gz'
+                               % generateData.FileGenerator.yearStr)
+
+    def setUp(self):
+        os.makedirs(self.directory, exist_ok=True)
+        years = (generateData.FileGenerator.yearStr,) + generateData.FileGenerator.historicalYears
+        syntheticData.writeYears(self.directory, years, self.rows, self.numColumns,
+                                 seed=self.seed)
+        shutil.copy(os.path.join(here, generateData.FileGenerator.dataTemplateFile),
+                    self.directory)
+        os.makedirs(os.path.join(self.directory, generateData.FileGenerator.outdir),
+                    exist_ok=True)
+
+    def time(self, run, setUp=None):
+        '''
+        The best time in seconds of repeat calls of run(setUp()), not counting setUp.
+        '''
+        best = None
+        for unused in range(self.repeat):
+            arg = setUp() if setUp is not None else None
+            start = time.perf_counter()
+            run(arg)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best
+
+    def loadedTable(self):
+        return cc.readFile(self.fn, columns=cc.pipelineColumns)
+
+    def generator(self):
+        fg = generateData.FileGenerator()
+        fg.quiet = True
+        fg.force = True
+        return fg
+
+    def runStage(self, stage):
+        if stage == 'load':
+            return self.time(lambda unused: cc.readFile(self.fn, columns=cc.pipelineColumns,
+                                                        useCache=False))
+        if stage == 'load_cached':
+            self.loadedTable()  # make sure the cache is there
+            return self.time(lambda unused: self.loadedTable())
+        if stage == 'join':
+            history = generateData.FileGenerator.historicalYears
+            return self.time(
+                lambda table: scorecardYears.ScorecardYears(history).linkHistory(table),
+                self.loadedTable)
+        if stage == 'filter':
+            return self.time(self.filterAll, self.loadedTable)
+        if stage == 'render':
+            return self.time(self.renderAll, self.generator)
+        if stage == 'write':
+            return self.time(lambda fg: fg.generateAll(), self.generator)
+        if stage == 'screwy':
+            return self.time(self.screwy)
+        raise ValueError('No stage %r' % stage)
+
+    @staticmethod
+    def filterAll(table):
+        engine = cc.FilterEngine(table)
+        for testType, ranges in (('SAT', generateData.satRanges),
+                                 ('ACT', generateData.actRanges)):
+            for testMin, testMax, unused_explain in ranges:
+                for level in range(1, 6):
+                    engine.selectIndices(testType, testMin, testMax, costLevel=level)
+
+    @staticmethod
+    def renderAll(fg):
+        for incomeLevel, stateAbbr, testType in fg.pageList():
+            ranges = generateData.satRanges if testType == 'SAT' else generateData.actRanges
+            for testData in ranges:
+                fg.stateFilteredTestRange(incomeLevel, stateAbbr, testData, testType)
+
+    @staticmethod
+    def screwy(unused):
+        with contextlib.redirect_stdout(io.StringIO()):
+            screwy_costs.findScrewy()
+
+    def run(self, stages=None):
+        '''
+        Sets up the directory, times the stages (default: all), and returns
+        the results as a dict.
+        '''
+        self.setUp()
+        timings = {}
+        previousDirectory = os.getcwd()
+        os.chdir(self.directory)  # FileGenerator and findScrewy use relative paths
+        try:
+            for stage in stages or self.stages:
+                timings[stage] = self.runStage(stage)
+        finally:
+            os.chdir(previousDirectory)
+        return {'rows': self.rows,
+                'columns': len(syntheticData.columnNames(self.numColumns)),
+                'repeat': self.repeat,
+                'python': sys.version.split()[0],
+                'stages': timings,
+                }
+
+
+def compare(results, baseline, tolerance=1.25):
+    '''
+    Prints each stage's time next to the baseline's and returns the list of
+    stages more than tolerance times slower than it.
+    '''
+    if baseline and ((baseline.get('rows'), baseline.get('columns'))
+                     != (results['rows'], results['columns'])):
+        print("Baseline was for %s rows and %s columns; comparing anyhow."
+              % (baseline.get('rows'), baseline.get('columns')))
+    slower = []
+    print("%-12s %10s %10s %7s" % ('stage', 'seconds', 'baseline', 'ratio'))
+    for stage, seconds in results['stages'].items():
+        before = baseline.get('stages', {}).get(stage)
+        if not before:
+            print("%-12s %10.4f %10s %7s" % (stage, seconds, '-', '-'))
+            continue
+        ratio = seconds / before
+        flag = ''
+        if ratio > tolerance:
+            slower.append(stage)
+            flag = '  SLOWER'
+        print("%-12s %10.4f %10.4f %7.2f%s" % (stage, seconds, before, ratio, flag))
+    return slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the college costs pipeline.')
+    parser.add_argument('--rows', type=int, default=7000)
+    parser.add_argument('--columns', type=int, default=None,
+                        help='total number of columns in the synthetic files')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stage', action='append', choices=Benchmark.stages,
+                        help='only time this stage (can be repeated)')
+    parser.add_argument('--dir', help='scratch directory (default: a temporary one)')
+    parser.add_argument('--baseline', default=defaultBaseline)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store these results as the baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        directory = args.dir or stack.enter_context(tempfile.TemporaryDirectory())
+        results = Benchmark(directory, args.rows, args.columns, args.repeat).run(args.stage)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+        for stage, seconds in results['stages'].items():
+            print("%-12s %10.4f" % (stage, seconds))
+        print("Saved as", args.baseline)
+    else:
+        try:
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+        except OSError:
+            baseline = {}
+            print("No baseline at %s; use --save-baseline to make one." % args.baseline)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
@@ -11,8 +11,22 @@
 '''
 System for searching college costs by income levels
 '''
+import array
+import bisect
+import concurrent.futures
 import csv
 import gzip
+import heapq
+import io
+import itertools
+import operator
+import queue
+import re
+import sys
+import threading
+import warnings
+
+import parseCache
 
 stateList = [l.upper() for l in ("al ak az ar ca co ct dc de fl ga hi id il in ia ks " + 
     "ky la me md ma mi mn ms mo mt ne nv nh nj nm ny nc nd oh ok or pa " + 
@@ -30,65 +44,572 @@ incomeLevels = [None,
 
 costCutoffs = [None, 12000, 17000, 25000, 37000, 59000, 90000]
 
+# every column that filterRows, School's properties, FileGenerator and screwy_costs read.
+pipelineColumns = ['UNITID', 'INSTNM', 'STABBR', 'PREDDEG', 'CONTROL',
+                   'SATVR25', 'SATVR75', 'SATMT25', 'SATMT75', 'SATVRMID', 'SATMTMID',
+                   'ACTCM25', 'C150_4_POOLED_SUPP', 'C200_L4_POOLED_SUPP',
+                   'NPT4_PUB', 'NPT4_PRIV',
+                   'NPT41_PUB', 'NPT42_PUB', 'NPT43_PUB', 'NPT44_PUB', 'NPT45_PUB',
+                   'NPT41_PRIV', 'NPT42_PRIV', 'NPT43_PRIV', 'NPT44_PRIV', 'NPT45_PRIV',
+                   ]
+
 
-def readFile(fn='college_data_2022.csv.gz'):
+def readFile(fn='college_data_2022.csv.gz', columns=None, stream=False, useCache=True):
     '''
     college_data_year.csv is the data from collegescorecard.ed.gov/data called "Scorecard data"
     used to be up-to-date, but no longer, at
     https://s3.amazonaws.com/ed-college-choice-public/Most+Recent+Cohorts+(Scorecard+Elements).csv
+    
+    Returns a SchoolTable, which iterates (and indexes) as a list of School objects.
+    
+    If columns is a list of column names (any case), only those columns are converted and kept;
+    names not in the file are ignored (asking a School for them raises AttributeError as usual).
+    pipelineColumns has everything that the rest of the system needs.
+    
+    If stream is True, returns a generator of School objects instead, which holds only
+    SchoolTable.streamChunkSize rows in memory at a time (plus any Schools the caller keeps).
+    
+    Unless useCache is False (or streaming), the parsed columns are kept in a binary
+    cache next to fn (see parseCache) and later calls for the same columns load from it
+    as long as fn has not changed.
+    
+    If columns is given, each of them that has cells not fitting the rest of the column
+    (text in a numeric column, which is read as None, other than expectedTextCells)
+    gives a MixedColumnWarning; see SchoolTable.mixedColumns().
+    '''
+    if stream:
+        return iterSchools(fn, columns)
+
+    table = None
+    if useCache:
+        cached = parseCache.load(fn, columns)
+        if cached is not None:
+            header, columnData = cached
+            table = SchoolTable(header, [Column.fromStorage(*c) for c in columnData])
+        else:
+            source = parseCache.sourceInfo(fn)
+
+    if table is None:
+        with openText(fn) as csvfile:
+            reader = csv.reader(csvfile)
+            header, rows = projectRows(reader, columns)
+            table = SchoolTable.fromRows(header, rows)
+        if useCache:
+            parseCache.save(fn, columns, table.header, table.columns, source)
+
+    if columns is not None:
+        for name, description in table.mixedColumns().items():
+            # reported at the data file, since readFile may be called from a worker thread
+            warnings.warn_explicit('column %s: %s' % (name, description),
+                                   MixedColumnWarning, fn, 1)
+    return table
+
+
+def readFiles(files, useCache=True):
     '''
-    header = []
-    rows = []
+    readFile for several files at once, each in its own thread (so that one file's
+    decompression goes on while another is being parsed).  files is a list of filenames
+    or of (filename, columns) tuples; returns their SchoolTables in the same order.
+    '''
+    files = [(f, None) if isinstance(f, str) else f for f in files]
+    if len(files) == 1:
+        fn, columns = files[0]
+        return [readFile(fn, columns=columns, useCache=useCache)]
+    with concurrent.futures.ThreadPoolExecutor(len(files)) as executor:
+        futures = [executor.submit(readFile, fn, columns=columns, useCache=useCache)
+                   for fn, columns in files]
+        return [future.result() for future in futures]
+
+
+def openText(fn):
+    '''
+    Opens a .csv.gz file for reading as text, like gzip.open(fn, mode='rt',
+    encoding='latin-1') (the same newline handling) but with the decompression
+    running ahead in a background thread; see GzipPipe.
+    '''
+    # encoding is guessed, but appears right
+    # King's college or something is wrong...
+    return io.TextIOWrapper(io.BufferedReader(GzipPipe(fn)), encoding='latin-1')
+
+
+class GzipPipe(io.RawIOBase):
+    '''
+    The decompressed bytes of a .gz file as a raw binary stream.  A background thread
+    decompresses blockSize bytes at a time into a queue holding at most queueBlocks
+    blocks, which reads take from, so parsing one block overlaps decompressing the next
+    ones without the whole file ever being in memory.
     
-    with gzip.open(fn, mode='rt', encoding='latin-1') as csvfile: # encoding is guessed, but appears right
-        reader = csv.reader(csvfile)      # King's college or something is wrong...
-        for i, row in enumerate(reader):
-            if i == 0:
-                header = row
-            else:
-                rows.append(School(row, header))
+    Errors in decompressing are raised by the read that would have gotten that data.
+    '''
+    blockSize = 1 << 18
+    queueBlocks = 8
+
+    def __init__(self, fn):
+        super().__init__()
+        self._gzipFile = gzip.open(fn, 'rb')  # so that a missing file raises here
+        self._queue = queue.Queue(self.queueBlocks)
+        self._stopping = threading.Event()
+        self._pending = memoryview(b'')
+        self._finished = False
+        self._thread = threading.Thread(target=self._decompress, daemon=True)
+        self._thread.start()
+
+    def _decompress(self):
+        try:
+            with self._gzipFile:
+                while not self._stopping.is_set():
+                    block = self._gzipFile.read(self.blockSize)
+                    self._put(block)
+                    if not block:
+                        return
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stopping.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            if self._finished:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                self._finished = True
+                raise item
+            if not item:
+                self._finished = True
+                return 0
+            self._pending = memoryview(item)
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stopping.set()
+            self._thread.join()
+        super().close()
+
+
+def iterSchools(fn='college_data_2022.csv.gz', columns=None):
+    '''
+    Generator version of readFile(fn, columns): yields one School at a time, converting
+    SchoolTable.streamChunkSize rows at a time.
+    '''
+    with openText(fn) as csvfile:
+        reader = csv.reader(csvfile)
+        header, rows = projectRows(reader, columns)
+        for table in SchoolTable.iterChunks(header, rows, SchoolTable.streamChunkSize):
+            yield from table
+
+
+def projectRows(reader, columns=None):
+    '''
+    Reads the header from reader (a csv.reader) and returns it along with an iterator
+    over the remaining rows, both cut down to just the named columns (any case) in
+    the order they appear in the file.  If columns is None, nothing is cut.
+    '''
+    header = next(reader)
+    if columns is None:
+        return header, reader
+
+    headerIndex = makeHeaderIndex(header)
+    positions = sorted({headerIndex[c.lower()] for c in columns if c.lower() in headerIndex})
+    numColumns = len(header)
+    if not positions:  # none of the columns are in this file
+        getter = lambda row: ()
+    elif len(positions) == 1:
+        getter = lambda row, p=positions[0]: (row[p],)
+    else:
+        getter = operator.itemgetter(*positions)
+
+    def projected():
+        for row in reader:
+            if len(row) < numColumns:
+                row = row + ['NULL'] * (numColumns - len(row))
+            yield getter(row)
+
+    return [header[p] for p in positions], projected()
+
+
+def makeHeaderIndex(header):
+    '''
+    Returns a dict mapping the lowercased name of every column in header to its position,
+    so that looking up a column is one dict access rather than a scan of thousands of
+    headers.  Built once per file and shared by every School from that file.
+    
+    If two columns have the same name (ignoring case), the first one wins.
+    '''
+    headerIndex = {}
+    for i, h in enumerate(header):
+        headerIndex.setdefault(h.lower(), i)
+    return headerIndex
+
+
+intRe = re.compile(r'\s*[-+]?\d+\s*')
+floatRe = re.compile(r'\s*[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?\s*')
+
+
+def cellType(d):
+    '''
+    Returns int or float if the cell (not 'NULL') looks like that kind of number,
+    otherwise str.  Uses regular expressions rather than trying int() and float(),
+    so no exceptions get raised.
+    '''
+    if intRe.fullmatch(d):
+        return int
+    if floatRe.fullmatch(d):
+        return float
+    return str
+
+
+def inferKind(cells):
+    '''
+    Given a sample of non-'NULL' cells from one column, return the kind of column that
+    they best fit: 'int', 'float', or 'str'.  A column is numeric if at least half
+    of the cells are numbers; the rest will be treated as odd cells.
+    '''
+    types = [cellType(d) for d in cells]
+    numbers = len(types) - types.count(str)
+    if numbers * 2 < len(types):
+        return 'str'
+    if float in types:
+        return 'float'
+    return 'int'
+
+
+# values in Column.nulls
+NULL = 1
+ODD = 2
+_oddCell = object()  # placeholder while converting
+# text that the Scorecard puts in numeric columns on purpose; read as None (and still
+# marked ODD, see Column.isOdd) but not counted as odd cells.
+expectedTextCells = frozenset(['PrivacySuppressed'])
+
+
+class MixedColumnWarning(UserWarning):
+    '''
+    Given by readFile for a requested column with cells that do not fit its kind.
+    '''
+
+
+class Column(object):
+    '''
+    One column of a SchoolTable.  Numeric columns are kept in an array.array
+    with a bytearray null mask (1 = the cell was 'NULL', 2 = the cell was an odd
+    cell, see below), text columns as a list of interned strings (None for 'NULL').
+    
+    kind is one of 'null' (nothing but 'NULL' so far), 'int', 'float', or 'str'.
+    It is inferred from the first inferenceSampleSize non-'NULL' cells, after which
+    cells are converted in bulk, a chunk at a time.  The only change of kind after that is
+    from 'int' to 'float'.
+    
+    Cells that do not fit the kind -- text in a numeric column (which become None,
+    but see isOdd()) or numbers in a text column (which stay strings) -- are counted in
+    oddCount, with a few of them kept in oddExamples; see describeOddCells().
+    The expectedTextCells, like 'PrivacySuppressed', are not counted.
+    '''
+    __slots__ = ('kind', 'values', 'nulls', 'length', 'oddCount', 'oddExamples')
+    inferenceSampleSize = 256
+    maxOddExamples = 3
+
+    def __init__(self, kind='null'):
+        self.length = 0
+        self.oddCount = 0
+        self.oddExamples = []
+        self._store(kind)
+
+    @classmethod
+    def fromStorage(cls, kind, values, nulls, length, oddCount=0, oddExamples=()):
+        '''
+        Make a column from already-built storage, such as from parseCache.load.
+        values and nulls can be anything indexable the right way, like memoryviews.
+        '''
+        column = cls()
+        column.kind = kind
+        column.values = values
+        column.nulls = nulls
+        column.length = length
+        column.oddCount = oddCount
+        column.oddExamples = list(oddExamples)
+        return column
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if self.nulls is not None:
+            if self.nulls[i]:
+                return None
+            return self.values[i]
+        if self.values is None:
+            if i >= self.length:
+                raise IndexError("Column index out of range")
+            return None
+        return self.values[i]
+
+    def tolist(self):
+        '''
+        Every cell of the column as a list, with None for 'NULL' (and odd) cells.
+        '''
+        if self.nulls is not None:
+            return [None if n else v for v, n in zip(self.values, self.nulls)]
+        if self.values is None:
+            return [None] * self.length
+        return list(self.values)
+
+    def isOdd(self, i):
+        '''
+        True if cell i of a numeric column was text, such as 'PrivacySuppressed',
+        rather than a number or 'NULL'.
+        '''
+        return self.nulls is not None and self.nulls[i] == ODD
+
+    def describeOddCells(self):
+        '''
+        Returns None if every cell fit the column's kind, otherwise a short description.
+        '''
+        if not self.oddCount:
+            return None
+        if self.kind == 'str':
+            what = 'look like numbers in a text column'
+        else:
+            what = 'are text in a%s %s column (read as None)' % (
+                'n' if self.kind == 'int' else '', self.kind)
+        return '%d of %d cells %s, e.g. %s' % (
+            self.oddCount, self.length, what, ', '.join(repr(d) for d in self.oddExamples))
+
+    def extend(self, cells):
+        '''
+        Add a chunk of raw CSV cells to the end of the column.
+        '''
+        present = [d for d in cells if d != 'NULL']
+        if self.kind == 'null':
+            if not present:
+                self.length += len(cells)
+                return
+            self._store(inferKind(present[:self.inferenceSampleSize]))
+
+        if self.kind == 'str':
+            self.values.extend([None if d == 'NULL' else sys.intern(d) for d in cells])
+            numberLike = [d for d in present if cellType(d) is not str]
+            self._addOddCells(numberLike)
+        else:
+            numbers = iter(self._convertNumbers(present))
+            merged = [None if d == 'NULL' else next(numbers) for d in cells]
+            self.nulls.extend([NULL if v is None else ODD if v is _oddCell else 0
+                               for v in merged])
+            merged = [0 if v is None or v is _oddCell else v for v in merged]
+            try:
+                self.values.extend(merged)
+            except OverflowError:  # an int too big for the array; very unlikely
+                del self.values[self.length:]
+                self.kind = 'float'
+                self.values = array.array('d', self.values)
+                self.values.extend(merged)
+        self.length += len(cells)
+
+    def _convertNumbers(self, present):
+        '''
+        Convert the non-'NULL' cells to numbers, in bulk if they all are numbers of the
+        column's kind (promoting the column to float if need be), returning _oddCell
+        in the place of any text cells.
+        '''
+        if self.kind == 'int':
+            try:
+                return list(map(int, present))
+            except ValueError:
+                pass
+        try:
+            numbers = list(map(float, present))
+        except ValueError:
+            numbers = None
+
+        if numbers is None:
+            types = [cellType(d) for d in present]
+            oddCells = [d for d, t in zip(present, types)
+                        if t is str and d not in expectedTextCells]
+            self._addOddCells(oddCells)
+            if self.kind == 'int' and float not in types:
+                return [int(d) if t is int else _oddCell for d, t in zip(present, types)]
+            numbers = [_oddCell if t is str else float(d) for d, t in zip(present, types)]
+        if self.kind == 'int':
+            self.kind = 'float'
+            self.values = array.array('d', self.values)
+        return numbers
+
+    def _addOddCells(self, oddCells):
+        self.oddCount += len(oddCells)
+        for d in oddCells:
+            if len(self.oddExamples) >= self.maxOddExamples:
+                break
+            if d not in self.oddExamples:
+                self.oddExamples.append(d)
+
+    def _store(self, kind):
+        '''
+        Set up empty storage for kind, filling in None for every cell so far.
+        '''
+        self.kind = kind
+        if kind in ('int', 'float'):
+            self.values = array.array('q' if kind == 'int' else 'd', bytes(8 * self.length))
+            self.nulls = bytearray([NULL]) * self.length
+        elif kind == 'str':
+            self.values = [None] * self.length
+            self.nulls = None
+        else:
+            self.values = None
+            self.nulls = None
+
+
+class SchoolTable(object):
+    '''
+    All the rows of one Scorecard file stored by column rather than by row,
+    so that a file with thousands of columns does not keep millions of strings around.
+    
+    Iterating over it or indexing it gives School objects, which are lightweight
+    views onto one row.  The same School object is returned every time for a row,
+    so attributes set on it (like historical_data) stick.
+    '''
+    chunkSize = 2048
+    streamChunkSize = 256
+
+    def __init__(self, header, columns):
+        self.header = header
+        self.columns = columns
+        self.headerIndex = makeHeaderIndex(header)
+        self.attrLookup = {}  # attribute name as spelled -> Column
+        numRows = len(columns[0]) if columns else 0
+        self.schools = [School(self, i) for i in range(numRows)]
+        self._filterEngine = None
+
+    @classmethod
+    def fromRows(cls, header, rows):
+        '''
+        Build a table from an iterable of lists of strings (such as a csv.reader),
+        converting chunkSize rows at a time.
+        '''
+        columns = [Column() for _ in header]
+        for chunk in cls._chunks(header, rows):
+            cls._addChunk(columns, chunk)
+        return cls(header, columns)
+
+    @classmethod
+    def iterChunks(cls, header, rows, chunkSize=None):
+        '''
+        Like fromRows, but yields a separate table for every chunkSize rows
+        (default: cls.chunkSize).  The kind of each column is inferred once and
+        carried over from chunk to chunk.
+        '''
+        kinds = ['null'] * len(header)
+        for chunk in cls._chunks(header, rows, chunkSize):
+            columns = [Column(kind) for kind in kinds]
+            cls._addChunk(columns, chunk)
+            kinds = [column.kind for column in columns]
+            yield cls(header, columns)
+
+    @classmethod
+    def _chunks(cls, header, rows, chunkSize=None):
+        if chunkSize is None:
+            chunkSize = cls.chunkSize
+        numColumns = len(header)
+        chunk = []
+        for row in rows:
+            if len(row) != numColumns:  # ragged row; pad or trim it to the header
+                row = (list(row) + ['NULL'] * numColumns)[:numColumns]
+            chunk.append(row)
+            if len(chunk) >= chunkSize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _addChunk(columns, chunk):
+        for column, cells in zip(columns, zip(*chunk)):
+            column.extend(cells)
+
+    def __repr__(self):
+        return "<%s.%s %d rows, %d columns>" % (self.__module__, self.__class__.__name__,
+                                                len(self), len(self.columns))
+
+    def __len__(self):
+        return len(self.schools)
+
+    def __iter__(self):
+        return iter(self.schools)
+
+    def __getitem__(self, i):
+        return self.schools[i]
+
+    def column(self, attr):
+        '''
+        Returns the Column named attr (ignoring case) or raises AttributeError.
+        '''
+        try:
+            return self.attrLookup[attr]
+        except KeyError:
+            pass
+        i = self.headerIndex.get(attr.lower())
+        if i is None:
+            raise AttributeError("Row has no column %r" % attr)
+        self.attrLookup[attr] = self.columns[i]
+        return self.columns[i]
+
+    def value(self, attr, index):
+        return self.column(attr)[index]
+
+    def filterEngine(self):
+        '''
+        The FilterEngine for this table, made the first time it is asked for.
+        '''
+        if self._filterEngine is None:
+            self._filterEngine = FilterEngine(self)
+        return self._filterEngine
+
+    def mixedColumns(self):
+        '''
+        Returns a dict of column name to Column.describeOddCells() for every column
+        that had cells that did not fit its kind.
+        '''
+        out = {}
+        for h, column in zip(self.header, self.columns):
+            description = column.describeOddCells()
+            if description is not None:
+                out[h] = description
+        return out
 
-    return rows
 
 class School(object):
     '''
-    Takes in one school information object from the CSVfile...
+    One school (one row) of a SchoolTable.  Columns are available as attributes,
+    ignoring case, so school.instnm or school.NPT41_PUB.
     '''
-    def __init__(self, data, headers):
-        self.data = data
-        self.headers = headers
+    __slots__ = ('table', 'index', 'historical_data')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
         self.historical_data = None  # for looking up pre-Covid test scores
-        self.attrCache = {}
 
     def __repr__(self):
         return "<%s.%s %s>" % (self.__module__, self.__class__.__name__, 
                                   self.instnm[0:40])
 
     def __getattr__(self, attr):
-        if attr not in self.attrCache:
-            self.attrCache[attr] = self._getattrHelper(attr)
-        return self.attrCache[attr]
-
-    def _getattrHelper(self, attr):            
-        found = None
-        i = 0
-        for i, h in enumerate(self.headers):
-            if h.lower() == attr.lower():
-                found = i
-                break
-        if found is None:
+        # dunders are probed by copy, pickle, etc.; slots are only missing before __init__
+        if attr.startswith('__') or attr in School.__slots__:
             raise AttributeError("Row has no column %r" % attr)
-        d = self.data[i]
-        if d == 'NULL':
-            return None
-        try:
-            junk_intD = int(d) # catch value error.
-            if int(d) == float(d):
-                return int(d)
-            else:
-                return float(d)
-        except ValueError:
-            return d
+        return self.table.column(attr)[self.index]
         
     @property
     def isFourYear(self):
@@ -161,6 +682,8 @@ class School(object):
     @property
     def gradRate(self):
         gr = self.C150_4_POOLED_SUPP
+        if gr is None and self.table.column('C150_4_POOLED_SUPP').isOdd(self.index):
+            return None  # 'PrivacySuppressed' etc. means no rate, not try the other column.
         if gr is None:
             gr = self.C200_L4_POOLED_SUPP
         if gr is None:
@@ -213,79 +736,74 @@ class School(object):
     }
     
     def shortName(self, maxLen=30):
-        def big():
-            return (len(shortName) > maxLen)
-        shortName = self.instnm
-        if shortName in self.knownAbbreviations:
-            shortName = self.knownAbbreviations[shortName]
-            
-        if big():
-            shortName = shortName.replace('San Francisco', 'SF')
-        if big():
-            shortName = shortName.replace('United States', 'US')
-        if big():
-            shortName = shortName.replace('California State University-', 'CSU ')
-        if big():
-            shortName = shortName.replace('Inter American University of Puerto Rico', 'Inter Amer U. PR')
-
-        if big():
-            shortName = shortName.replace('California Polytechnic State University-', 'Cal Poly ')
-        if big():
-            # these have "-Penn State...' after them so redundant
-            shortName = shortName.replace('Pennsylvania State University-', '')
-        if big():
-            shortName = shortName.replace('North Carolina State University', 'NC State')
-        if big():
-            shortName = shortName.replace('niversity', 'niv.').replace('ollege', 'ol.').replace(
-                                                            'Theological Seminary', 'Seminary')
-        if big():
-            shortName = shortName.replace(' at ', ' ')
-        if big():
-            shortName = shortName.replace('niv.', '.').replace('ol.', '.').replace(
-                                                                        'Universidad ', 'U.')
-        if big():
-            shortName = shortName.replace('Institute', 'Inst.')
-        if big():
-            shortName = shortName.replace('California', 'Cal.')
-        if big():
-            shortName = shortName.replace('Campuses ', ' ').replace('Campuses', '')
-        if big():
-            shortName = shortName.replace('Campus ', ' ').replace('Campus', '')
-        if big():
-            shortName = shortName.replace('the ', '').replace('The ', '')
-        if big():
-            shortName = shortName.replace('Conservatory', 'Conserv.')
-        if big():
-            shortName = shortName.replace('Technology', 'Tech.')
-        if big():
-            shortName = shortName.replace('Saint', 'St.')
-        if big():
-            shortName = shortName.replace('School of ', '')
-        if big():
-            shortName = shortName.replace('School', '')
-        if big():
-            shortName = shortName.replace('Sciences', '')
-        if big():
-            shortName = shortName.replace('Science', '')
-        if big():
-            shortName = shortName.replace('of ', '')
-        if big():
-            shortName = shortName.replace('Seminary', 'Sem.')
-        if big():
-            shortName = shortName.replace('and ', '& ')
-        if big():
-            shortName = shortName.replace('Southern ', 'S. ')
-        if big():
-            shortName = shortName.replace(' & ', '&')
-
-        shortName = shortName.replace('  ', ' ')
-        
-        if big():
-            shortName = shortName[0:maxLen]
-            #print(shortName, '          ', self.instnm)
-        shortName = shortName.strip()
-            
-        return shortName
+        return shortenName(self.instnm, maxLen)
+
+
+# The steps that shortenName takes, in order, while the name is still too long.
+# Each step is one or more (old, new) replacements made one after another.
+shortNameRules = (
+    (('San Francisco', 'SF'),),
+    (('United States', 'US'),),
+    (('California State University-', 'CSU '),),
+    (('Inter American University of Puerto Rico', 'Inter Amer U. PR'),),
+    (('California Polytechnic State University-', 'Cal Poly '),),
+    (('Pennsylvania State University-', ''),),  # these have "-Penn State...' after them so redundant
+    (('North Carolina State University', 'NC State'),),
+    (('niversity', 'niv.'), ('ollege', 'ol.'), ('Theological Seminary', 'Seminary')),
+    ((' at ', ' '),),
+    (('niv.', '.'), ('ol.', '.'), ('Universidad ', 'U.')),
+    (('Institute', 'Inst.'),),
+    (('California', 'Cal.'),),
+    (('Campuses ', ' '), ('Campuses', '')),
+    (('Campus ', ' '), ('Campus', '')),
+    (('the ', ''), ('The ', '')),
+    (('Conservatory', 'Conserv.'),),
+    (('Technology', 'Tech.'),),
+    (('Saint', 'St.'),),
+    (('School of ', ''),),
+    (('School', ''),),
+    (('Sciences', ''),),
+    (('Science', ''),),
+    (('of ', ''),),
+    (('Seminary', 'Sem.'),),
+    (('and ', '& '),),
+    (('Southern ', 'S. '),),
+    ((' & ', '&'),),
+)
+
+_shortNames = {}  # (name, maxLen) -> shortenName(name, maxLen), for every school and year
+
+def shortenName(name, maxLen=30):
+    '''
+    A name of at most maxLen characters for a school named name: a known abbreviation,
+    or the name with shortNameRules applied one step at a time until it fits (and cut
+    off if it still does not).  Remembered, since every page asks again.
+    '''
+    key = (name, maxLen)
+    try:
+        return _shortNames[key]
+    except KeyError:
+        pass
+    shortName = School.knownAbbreviations.get(name, name)
+    for step in shortNameRules:
+        if len(shortName) <= maxLen:
+            break
+        for old, new in step:
+            shortName = shortName.replace(old, new)
+
+    shortName = shortName.replace('  ', ' ')
+    if len(shortName) > maxLen:
+        shortName = shortName[0:maxLen]
+    shortName = shortName.strip()
+    _shortNames[key] = shortName
+    return shortName
+
+def shortenNames(names, maxLen=30):
+    '''
+    shortenName for each of names (such as a SchoolTable's INSTNM column), as a list.
+    '''
+    shortNames = {name: shortenName(name, maxLen) for name in set(names)}
+    return [shortNames[name] for name in names]
 
 
 def getSAT25diff(rows):
@@ -306,66 +824,322 @@ def getSAT25diff(rows):
 
 
 def filterRows(rows, satMin=700, satMax=800, costMax=None, costLevel=1, stateAbbr=None):
-    rOut = []
-    for r in rows:
-        if r.gradRate is None or r.gradRate < .333333:
-            continue
-        if r.isPublic is False and r.isPrivate is False:
-            continue
-        if r.isFourYear is not True:
-            continue
-        if satMin is not None and r.sat25 is None:
-            continue
-        if (satMin is not None and satMax is not None and r.sat25 is not None and 
-                (r.sat25 < satMin or r.sat25 >= satMax)):
-            continue
-        if satMin is None and r.sat25 is not None:
-            continue
-        c = r.cost(costLevel)
-        if c is None:
-            continue
-        if costMax is not None and c > costMax:
-            continue
-        if stateAbbr is not None and r.isPublic and r.STABBR != stateAbbr:
-            continue
-        
-        rOut.append(r)
+    '''
+    Returns the four-year public and private schools in rows with a graduation rate of at
+    least a third, a combined SAT 25th percentile from satMin up to (not including) satMax,
+    and a cost at costLevel, sorted by that cost.  If satMin is None, returns instead the
+    schools with no SAT data.  If stateAbbr is given, public schools in other states
+    are left out.
     
-    rOut.sort(key=lambda r: r.cost(costLevel))
-    return rOut
+    See FilterEngine, which does the work.
+    '''
+    return FilterEngine.forRows(rows).select('SAT', satMin, satMax, costMax, costLevel, stateAbbr)
 
 def filterACTRows(rows, actMin=700, actMax=800, costMax=None, costLevel=1, stateAbbr=None):
-    rOut = []
-    for r in rows:
-        if r.gradRate is None or r.gradRate < .333333:
-            continue
-        if r.isPublic is False and r.isPrivate is False:
-            continue
-        if r.isFourYear is not True:
-            continue
-        if actMin is not None and r.act25 is None:
-            continue
-        if (actMin is not None and actMax is not None and r.act25 is not None and 
-                (r.act25 < actMin or r.act25 >= actMax)):
-            continue
-        if actMin is None and r.act25 is not None:
-            continue
-        c = r.cost(costLevel)
-        if c is None:
-            continue
-        if costMax is not None and c > costMax:
-            continue
-        if stateAbbr is not None and r.isPublic and r.STABBR != stateAbbr:
-            continue
+    '''
+    Same as filterRows but for the ACT composite 25th percentile.
+    '''
+    return FilterEngine.forRows(rows).select('ACT', actMin, actMax, costMax, costLevel, stateAbbr)
+
+
+class FilterEngine(object):
+    '''
+    Answers filterRows and filterACTRows queries for a list of Schools (or a SchoolTable).
+    
+    Everything about a school that the filters look at (graduation rate, control, degree
+    type, test scores, state, cost at each level) is worked out once per school and kept
+    in lists parallel to the schools, so that each query is a few passes over plain
+    lists followed by a sort of the row numbers by cost.
+    
+    Because SAT scores can come from historical_data, make the engine after that is set.
+    '''
+    def __init__(self, rows):
+        self.schools = list(rows)
+        schools = self.schools
+        self.gradRates = gradRates = [r.gradRate for r in schools]
+        self.isPublic = [r.isPublic for r in schools]
+        isPrivate = [r.isPrivate for r in schools]
+        isFourYear = [r.isFourYear for r in schools]
+        self.eligible = [i for i, (gr, pub, priv, four) in enumerate(
+                            zip(gradRates, self.isPublic, isPrivate, isFourYear))
+                         if gr is not None and gr >= .333333
+                            and (pub is not False or priv is not False)
+                            and four is True]
+        eligibleSchools = [schools[i] for i in self.eligible]
+        satData = [r.sat25_data() for r in eligibleSchools]
+        self.scores = {'SAT': self._spread([score for score, unused_est in satData]),
+                       'ACT': self._spread([r.act25 for r in eligibleSchools]),
+                       }
+        self.estimated = {'SAT': self._spread([est for unused_score, est in satData]),
+                          'ACT': self._spread([False] * len(eligibleSchools)),
+                          }
+        self.states = self._spread([r.STABBR for r in eligibleSchools])
+        self.costsByLevel = {}
+        self.scoreIndexes = {}
+        self.bestValueIndexes = {}
+
+    @classmethod
+    def forRows(cls, rows):
+        '''
+        SchoolTables keep their engine (see SchoolTable.filterEngine()); anything else
+        gets a new one.
+        '''
+        if isinstance(rows, SchoolTable):
+            return rows.filterEngine()
+        return cls(rows)
+
+    def _spread(self, eligibleValues):
+        '''
+        Turn a list of values for the eligible schools into one for every school.
+        '''
+        out = [None] * len(self.schools)
+        for i, v in zip(self.eligible, eligibleValues):
+            out[i] = v
+        return out
+
+    def costs(self, level):
+        '''
+        School.cost(level) for every eligible school (None for the others).
+        '''
+        if level not in self.costsByLevel:
+            schools = self.schools
+            self.costsByLevel[level] = self._spread([schools[i].cost(level)
+                                                     for i in self.eligible])
+        return self.costsByLevel[level]
+
+    def scoreIndex(self, testType='SAT'):
+        '''
+        The ScoreIndex of the eligible schools for testType ('SAT' or 'ACT'),
+        made the first time it is asked for.
+        '''
+        if testType not in self.scoreIndexes:
+            self.scoreIndexes[testType] = ScoreIndex(self.eligible, self.scores[testType],
+                                                     self.estimated[testType])
+        return self.scoreIndexes[testType]
+
+    def bestValueIndex(self, testType='SAT', level=1):
+        '''
+        The BestValueIndex for testType at income level, made the first time it is asked for.
+        '''
+        key = (testType, level)
+        if key not in self.bestValueIndexes:
+            self.bestValueIndexes[key] = BestValueIndex(self, testType, level)
+        return self.bestValueIndexes[key]
+
+    def bestValues(self, score, within, k=10, level=1, testType='SAT', gradMin=None,
+                   stateAbbr=None):
+        '''
+        The k cheapest schools at income level whose testType 25th percentile is within
+        `within` points of score (either way) and, if gradMin is given, whose graduation
+        rate is at least that; only schools filterRows could show are considered, and,
+        as there, stateAbbr leaves out public schools in other states.
+        '''
+        found = self.bestValueIndex(testType, level).query(score, within, k, gradMin, stateAbbr)
+        return [self.schools[i] for i in found]
+
+    def select(self, testType='SAT', scoreMin=700, scoreMax=800, costMax=None, costLevel=1,
+               stateAbbr=None):
+        '''
+        The schools matching the query, sorted by cost at costLevel; testType is 'SAT'
+        or 'ACT'.  See filterRows.
+        '''
+        return [self.schools[i] for i in self.selectIndices(testType, scoreMin, scoreMax,
+                                                            costMax, costLevel, stateAbbr)]
+
+    def selectIndices(self, testType='SAT', scoreMin=700, scoreMax=800, costMax=None,
+                      costLevel=1, stateAbbr=None):
+        '''
+        Same as select() but returns positions in self.schools.
+        '''
+        scores = self.scores[testType]
+        costs = self.costs(costLevel)
+        if scoreMin is None:
+            found = [i for i in self.eligible if scores[i] is None]
+        elif scoreMax is None:  # any score at all, as filterRows has always done
+            found = [i for i in self.eligible if scores[i] is not None]
+        else:
+            found = sorted(self.scoreIndex(testType).positionsBetween(scoreMin, scoreMax))
+        if costMax is None:
+            found = [i for i in found if costs[i] is not None]
+        else:
+            found = [i for i in found if costs[i] is not None and costs[i] <= costMax]
+        if stateAbbr is not None:
+            isPublic = self.isPublic
+            states = self.states
+            found = [i for i in found if not isPublic[i] or states[i] == stateAbbr]
+        return sorted(found, key=costs.__getitem__)
+
+    def partition(self, rangesByTest, levels=(1, 2, 3, 4, 5)):
+        '''
+        Puts every eligible school into its score band and cost level buckets in one pass.
         
-        rOut.append(r)
+        rangesByTest maps 'SAT' and/or 'ACT' to a list of (scoreMin, scoreMax, ...) tuples
+        like generateData.satRanges; the bands may not overlap.  Returns a dict mapping
+        (testType, bandNumber, level) to the row positions that
+        selectIndices(testType, scoreMin, scoreMax, costLevel=level) would give,
+        already sorted by cost.
+        '''
+        finders = {testType: self._bandFinder(ranges) for testType, ranges in rangesByTest.items()}
+        buckets = {(testType, band, level): []
+                   for testType, ranges in rangesByTest.items()
+                   for band in range(len(ranges))
+                   for level in levels}
+        costsByLevel = [(level, self.costs(level)) for level in levels]
+        for i in self.eligible:
+            for testType, findBand in finders.items():
+                band = findBand(self.scores[testType][i])
+                if band is None:
+                    continue
+                for level, costs in costsByLevel:
+                    if costs[i] is not None:
+                        buckets[(testType, band, level)].append(i)
+
+        for (unused_testType, unused_band, level), found in buckets.items():
+            found.sort(key=self.costs(level).__getitem__)
+        return buckets
+
+    @staticmethod
+    def _bandFinder(ranges):
+        '''
+        Returns a function that takes a score (or None) and returns the number of the
+        range in ranges it belongs to, or None.  Uses a binary search on the range minimums.
+        '''
+        noScoreBand = None
+        bounded = []
+        for band, (scoreMin, scoreMax, *unused_rest) in enumerate(ranges):
+            if scoreMin is None:
+                noScoreBand = band
+            else:
+                bounded.append((scoreMin, float('inf') if scoreMax is None else scoreMax, band))
+        bounded.sort()
+        for previous, following in zip(bounded, bounded[1:]):
+            if following[0] < previous[1]:
+                raise ValueError('Score ranges overlap: %r' % (ranges,))
+        mins = [b[0] for b in bounded]
+
+        def findBand(score):
+            if score is None:
+                return noScoreBand
+            where = bisect.bisect_right(mins, score) - 1
+            if where < 0 or score >= bounded[where][1]:
+                return None
+            return bounded[where][2]
+
+        return findBand
+
+    def costTiers(self, indices, level):
+        '''
+        Splits row positions (sorted by cost at level) into the ones at or below
+        costCutoffs[level], the other ones at or below costCutoffs[level + 1], and the rest,
+        as School.belowCostLevel and belowExtremeCostLevel would.
+        '''
+        costs = self.costs(level)
+        cutoff = costCutoffs[level]
+        extremeCutoff = costCutoffs[level + 1]
+        return ([i for i in indices if costs[i] <= cutoff],
+                [i for i in indices if cutoff < costs[i] <= extremeCutoff],
+                [i for i in indices if costs[i] > extremeCutoff])
+
+
+class ScoreIndex(object):
+    '''
+    Schools sorted by a 25th percentile test score, so that the ones in any range of
+    scores can be found by binary search.  Made by FilterEngine.scoreIndex() from its
+    eligible row positions and its (spread) lists of scores and of whether each score
+    is estimated (see School.sat25_data); schools with no score are left out.
+    '''
+    def __init__(self, positions, scores, estimated):
+        ranked = sorted((scores[i], i) for i in positions if scores[i] is not None)
+        self.scores = [score for score, unused_i in ranked]
+        self.positions = [i for unused_score, i in ranked]
+        self.estimated = [estimated[i] for i in self.positions]
+
+    def __len__(self):
+        return len(self.scores)
+
+    def _slice(self, scoreMin=None, scoreMax=None):
+        start = 0 if scoreMin is None else bisect.bisect_left(self.scores, scoreMin)
+        end = len(self.scores) if scoreMax is None else bisect.bisect_left(self.scores,
+                                                                            scoreMax)
+        return slice(start, max(start, end))
+
+    def positionsBetween(self, scoreMin=None, scoreMax=None):
+        '''
+        Row positions of the schools with scoreMin <= score < scoreMax, by score
+        (either end can be None for no limit).
+        '''
+        return self.positions[self._slice(scoreMin, scoreMax)]
+
+    def between(self, scoreMin=None, scoreMax=None):
+        '''
+        (score, isEstimated, rowPosition) for the schools with
+        scoreMin <= score < scoreMax, by score.
+        '''
+        where = self._slice(scoreMin, scoreMax)
+        return list(zip(self.scores[where], self.estimated[where], self.positions[where]))
+
+
+class BestValueIndex(object):
+    '''
+    A grid over the schools of a FilterEngine that have a score for one test type and
+    a cost at one income level, for finding the cheapest schools near a score.
     
-    rOut.sort(key=lambda r: r.cost(costLevel))
-    return rOut
+    Each cell covers cellWidth points of score ('SAT' or 'ACT') and keeps its schools
+    sorted by cost, so a query only looks at the cells with schools that its score range
+    touches and stops in each one as soon as it has k matches.
+    '''
+    cellWidths = {'SAT': 50, 'ACT': 2}
+
+    def __init__(self, engine, testType='SAT', level=1):
+        self.engine = engine
+        self.cellWidth = self.cellWidths[testType]
+        scores = engine.scores[testType]
+        costs = engine.costs(level)
+        self.scores = scores
+        self.costs = costs
+        self.cells = {}  # cell number -> row positions sorted by (cost, position)
+        for i in engine.eligible:
+            if scores[i] is not None and costs[i] is not None:
+                self.cells.setdefault(scores[i] // self.cellWidth, []).append(i)
+        for found in self.cells.values():
+            found.sort(key=lambda i: (costs[i], i))
+        self.cellNumbers = sorted(self.cells)  # only the cells that have schools
+
+    def query(self, score, within, k=10, gradMin=None, stateAbbr=None):
+        '''
+        Row positions of the k cheapest schools with score - within <= score <= score + within
+        (see FilterEngine.bestValues), cheapest first.
+        '''
+        scoreMin = score - within
+        scoreMax = score + within
+        scores = self.scores
+        gradRates = self.engine.gradRates
+        isPublic = self.engine.isPublic
+        states = self.engine.states
+        candidates = []
+        cellNumbers = self.cellNumbers
+        first = bisect.bisect_left(cellNumbers, scoreMin // self.cellWidth)
+        last = bisect.bisect_right(cellNumbers, scoreMax // self.cellWidth)
+        for cell in cellNumbers[first:last]:
+            matches = []
+            for i in self.cells[cell]:
+                if not scoreMin <= scores[i] <= scoreMax:
+                    continue
+                if gradMin is not None and gradRates[i] < gradMin:
+                    continue
+                if stateAbbr is not None and isPublic[i] and states[i] != stateAbbr:
+                    continue
+                matches.append(i)
+                if len(matches) == k:
+                    break
+            candidates.append(matches)
+        costs = self.costs
+        merged = heapq.merge(*candidates, key=lambda i: (costs[i], i))
+        return list(itertools.islice(merged, k))
 
 
 def generateSimulation(costLevel=1, costMax=10000, pubStateOnly=''):
-    r = readFile()
+    r = readFile(columns=pipelineColumns)
     
     for satMin in range(700, 1500, 100):
         satMax = satMin + 99
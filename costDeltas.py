@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:         costDeltas.py
+# Purpose:      Compare costs, SAT scores, and graduation rates across years
+#
+# Authors:      Michael Scott Asato Cuthbert
+#
+# Copyright:    Copyright © 2016-23 Michael Scott Asato Cuthbert
+# License:      MIT, see LICENSE file
+#-------------------------------------------------------------------------------
+'''
+How did each school's cost at each income level (and its SAT 25th percentile and graduation
+rate) change between two or more years?
+
+    python costDeltas.py 2016 2022 --csv deltas.csv --json deltas.json
+
+The years are joined on unitid through scorecardYears.ScorecardYears, each measure is
+worked out once per year for every school, and the changes are taken from the
+first year given to each later one.
+'''
+import argparse
+import csv
+import json
+
+import collegeCosts as cc
+import scorecardYears
+
+# measure name -> function of a School
+measures = {
+    'cost': lambda sch: sch.cost(),
+    'cost1': lambda sch: sch.cost(1),
+    'cost2': lambda sch: sch.cost(2),
+    'cost3': lambda sch: sch.cost(3),
+    'cost4': lambda sch: sch.cost(4),
+    'cost5': lambda sch: sch.cost(5),
+    'sat25': lambda sch: sch.sat25,
+    'gradRate': lambda sch: sch.gradRate,
+}
+
+
+class YearComparison:
+    '''
+    Every school in any of years, with each of the measures for each year, lined up by
+    unitid (the order of self.store.unitids).
+    '''
+    def __init__(self, years, useCache=True):
+        self.store = scorecardYears.ScorecardYears(years, columns=cc.pipelineColumns,
+                                                   useCache=useCache)
+        self.years = self.store.years
+        for year in self.years:
+            self.store.table(year)
+        self.values = {name: {year: self._aligned(year, measure) for year in self.years}
+                       for name, measure in measures.items()}
+        self.names, self.states = self._latestNames()
+
+    def _aligned(self, year, measure):
+        schools = self.store.table(year).schools
+        yearValues = [measure(sch) for sch in schools]
+        return [None if row < 0 else yearValues[row] for row in self.store.rowIndex[year]]
+
+    def _latestNames(self):
+        names = [None] * len(self.store.unitids)
+        states = [None] * len(self.store.unitids)
+        for year in self.years:  # later years overwrite earlier ones
+            schools = self.store.table(year).schools
+            for i, row in enumerate(self.store.rowIndex[year]):
+                if row >= 0:
+                    names[i] = schools[row].instnm
+                    states[i] = schools[row].STABBR
+        return names, states
+
+    def deltas(self, name, fromYear, toYear):
+        '''
+        The change in measure name from fromYear to toYear for every school, or None
+        where either year has no value.
+        '''
+        before = self.values[name][str(fromYear)]
+        after = self.values[name][str(toYear)]
+        return [None if b is None or a is None else a - b for b, a in zip(before, after)]
+
+    def comparisons(self):
+        '''
+        (fromYear, toYear) pairs: the first year against each later one.
+        '''
+        return [(self.years[0], year) for year in self.years[1:]]
+
+    def biggestMovers(self, name, fromYear, toYear, n=10):
+        '''
+        Returns the n schools whose measure rose the most and the n whose measure fell the most,
+        each as a list of dicts with unitid, instnm, stabbr, and change.  Either list is
+        shorter than n if fewer schools rose (or fell).
+        '''
+        changes = [(d, i) for i, d in enumerate(self.deltas(name, fromYear, toYear))
+                   if d is not None]
+        changes.sort()
+        fallers = [(d, i) for d, i in changes[:n] if d < 0]
+        risers = [(d, i) for d, i in changes[::-1][:n] if d > 0]
+        return ([self._mover(i, d) for d, i in risers],
+                [self._mover(i, d) for d, i in fallers])
+
+    def _mover(self, i, change):
+        return {'unitid': self.store.unitids[i],
+                'instnm': self.names[i],
+                'stabbr': self.states[i],
+                'change': change,
+                }
+
+    def header(self):
+        out = ['unitid', 'instnm', 'stabbr']
+        for name in measures:
+            out.extend('%s_%s' % (name, year) for year in self.years)
+            out.extend('%s_change_%s_%s' % (name, fromYear, toYear)
+                       for fromYear, toYear in self.comparisons())
+        return out
+
+    def rows(self):
+        '''
+        One list per school in the order of header(), for schools in at least two of the years.
+        '''
+        columns = [self.store.unitids, self.names, self.states]
+        for name in measures:
+            columns.extend(self.values[name][year] for year in self.years)
+            columns.extend(self.deltas(name, fromYear, toYear)
+                           for fromYear, toYear in self.comparisons())
+        inYears = [sum(1 for year in self.years if self.store.rowIndex[year][i] >= 0)
+                   for i in range(len(self.store.unitids))]
+        return [list(row) for row, count in zip(zip(*columns), inYears) if count >= 2]
+
+    def writeCSV(self, fn):
+        with open(fn, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.header())
+            for row in self.rows():
+                writer.writerow(['' if v is None else v for v in row])
+
+    def report(self, n=10):
+        '''
+        A dict with the years and, for every comparison and cost level, the n biggest
+        risers and fallers.
+        '''
+        movers = {}
+        for fromYear, toYear in self.comparisons():
+            for name in measures:
+                risers, fallers = self.biggestMovers(name, fromYear, toYear, n)
+                movers['%s_%s_%s' % (name, fromYear, toYear)] = {'rose': risers,
+                                                                 'fell': fallers}
+        return {'years': self.years,
+                'schools': len(self.rows()),
+                'biggest_movers': movers,
+                }
+
+    def writeJSON(self, fn, n=10):
+        with open(fn, 'w', encoding='utf-8') as f:
+            json.dump(self.report(n), f, indent=1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare college costs across years.')
+    parser.add_argument('years', nargs='+', help='years to compare, the first is the baseline')
+    parser.add_argument('--csv', help='write every school\'s values and changes here')
+    parser.add_argument('--json', help='write the biggest movers here')
+    parser.add_argument('--top', type=int, default=10, help='how many movers to list')
+    args = parser.parse_args()
+    if len(args.years) < 2:
+        parser.error('need at least two years')
+    comparison = YearComparison(args.years)
+    if args.csv:
+        comparison.writeCSV(args.csv)
+    if args.json:
+        comparison.writeJSON(args.json, args.top)
+    for fromYear, toYear in comparison.comparisons():
+        for level in range(1, 6):
+            risers, fallers = comparison.biggestMovers('cost%d' % level, fromYear, toYear, 3)
+            print("Income level %d, %s to %s" % (level, fromYear, toYear))
+            for mover in risers + fallers:
+                print("  %6d %-40s %+7d" % (mover['unitid'], mover['instnm'][0:40],
+                                            mover['change']))
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:         cutoffSweep.py
+# Purpose:      See what different costCutoffs would do without making the pages
+#
+# Authors:      Michael Scott Asato Cuthbert
+#
+# Copyright:    Copyright © 2016-23 Michael Scott Asato Cuthbert
+# License:      MIT, see LICENSE file
+#-------------------------------------------------------------------------------
+'''
+For each of several candidate versions of collegeCosts.costCutoffs, counts how many
+schools in each score band, income level, and state would be in the main table (cheap),
+behind "Show More Expensive" (expensive), or shown in red there (very expensive) --
+the split that FileGenerator.costTiers makes -- without writing any HTML.
+
+    python cutoffSweep.py --scale .9 1 1.1 --csv sweep.csv
+    python cutoffSweep.py --cutoffs 12000,17000,25000,37000,59000,90000 --cutoffs 10000,...
+
+A state's counts are those of its page: every private school plus the state's public ones.
+The schools are put in their buckets once; each bucket keeps the costs of its private
+schools, and of each state's public schools, sorted, so each cutoff vector costs only a
+few binary searches per bucket and state.
+'''
+import argparse
+import bisect
+import csv
+
+import collegeCosts as cc
+import generateData
+
+tierNames = ('cheap', 'expensive', 'very_expensive')
+
+
+class CutoffSweep(object):
+    '''
+    Holds the sorted costs for every (testType, band, level) bucket of the schools in
+    engine (a cc.FilterEngine): all of them, the private ones, and the public ones of
+    each state.
+
+    Like the pages, a state's counts are for every private school plus that state's
+    public schools (see cc.FilterEngine.selectIndices(stateAbbr=...)); the counts for
+    state None are the whole country.  states (default: those in cc.stateList) are the
+    states to count.
+    '''
+    def __init__(self, engine, rangesByTest=None, levels=(1, 2, 3, 4, 5), states=None):
+        if rangesByTest is None:
+            rangesByTest = {'SAT': generateData.satRanges, 'ACT': generateData.actRanges}
+        if states is None:
+            states = [st for st in dict.fromkeys(cc.stateList) if st is not None]
+        self.rangesByTest = rangesByTest
+        self.levels = levels
+        self.states = states
+        self.bucketCosts = {}  # (testType, band, level) -> sorted costs
+        self.privateCosts = {}  # (testType, band, level) -> sorted costs of private schools
+        self.publicCosts = {}  # (testType, band, level) -> {state: sorted costs of public ones}
+        for key, found in engine.partition(rangesByTest, levels).items():
+            costs = engine.costs(key[2])
+            self.bucketCosts[key] = [costs[i] for i in found]  # already sorted
+            private = []
+            publicByState = {}
+            for i in found:
+                if not engine.isPublic[i]:
+                    private.append(costs[i])
+                else:
+                    publicByState.setdefault(engine.states[i], []).append(costs[i])
+            self.privateCosts[key] = private
+            self.publicCosts[key] = publicByState
+
+    @staticmethod
+    def tierCounts(sortedCosts, cutoff, extremeCutoff):
+        '''
+        How many of sortedCosts are <= cutoff, then <= extremeCutoff, then above it.
+        '''
+        cheap = bisect.bisect_right(sortedCosts, cutoff)
+        notVery = bisect.bisect_right(sortedCosts, extremeCutoff)
+        return (cheap, max(0, notVery - cheap), len(sortedCosts) - max(cheap, notVery))
+
+    def counts(self, cutoffs):
+        '''
+        For one cutoff vector (shaped like cc.costCutoffs), a dict of
+        (testType, band, level, state) -> (cheap, expensive, veryExpensive) counts,
+        where state None is the whole country.
+        '''
+        out = {}
+        for key, sortedCosts in self.bucketCosts.items():
+            testType, band, level = key
+            cutoff = cutoffs[level]
+            extremeCutoff = cutoffs[level + 1]
+            out[(testType, band, level, None)] = self.tierCounts(sortedCosts, cutoff,
+                                                                 extremeCutoff)
+            private = self.tierCounts(self.privateCosts[key], cutoff, extremeCutoff)
+            publicByState = self.publicCosts[key]
+            for state in self.states:
+                public = self.tierCounts(publicByState.get(state, []), cutoff, extremeCutoff)
+                out[(testType, band, level, state)] = tuple(a + b
+                                                            for a, b in zip(private, public))
+        return out
+
+    def sweep(self, cutoffVectors):
+        '''
+        counts() for each of cutoffVectors, as a list.
+        '''
+        return [self.counts(cutoffs) for cutoffs in cutoffVectors]
+
+    def summary(self, counts):
+        '''
+        Total tier counts for the whole country by (testType, level), summed over the bands.
+        '''
+        out = {}
+        for (testType, unused_band, level, state), tiers in counts.items():
+            if state is not None:
+                continue
+            total = out.get((testType, level), (0, 0, 0))
+            out[(testType, level)] = tuple(a + b for a, b in zip(total, tiers))
+        return out
+
+    def writeCSV(self, fn, cutoffVectors, results=None):
+        if results is None:
+            results = self.sweep(cutoffVectors)
+        with open(fn, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['vector', 'cutoffs', 'test', 'band', 'level', 'state']
+                            + list(tierNames))
+            for vector, (cutoffs, counts) in enumerate(zip(cutoffVectors, results)):
+                cutoffStr = ' '.join(str(c) for c in cutoffs[1:])
+                for (testType, band, level, state), tiers in sorted(
+                        counts.items(), key=lambda kv: (kv[0][:3], kv[0][3] or '')):
+                    explain = self.rangesByTest[testType][band][2]
+                    writer.writerow([vector, cutoffStr, testType, explain, level,
+                                     state or 'ALL'] + list(tiers))
+
+
+def scaledCutoffs(scale, cutoffs=None):
+    '''
+    cutoffs (default cc.costCutoffs) with every dollar amount multiplied by scale.
+    '''
+    if cutoffs is None:
+        cutoffs = cc.costCutoffs
+    return [None] + [int(round(c * scale)) for c in cutoffs[1:]]
+
+
+def parseCutoffs(text):
+    '''
+    '12000,17000,...' (six numbers, for costCutoffs[1:]) -> a cutoff vector.
+    '''
+    numbers = [int(c) for c in text.split(',')]
+    if len(numbers) != len(cc.costCutoffs) - 1:
+        raise ValueError('need %d cutoffs, not %d' % (len(cc.costCutoffs) - 1, len(numbers)))
+    return [None] + numbers
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Count schools in each cost tier for '
+                                                 'candidate cost cutoffs.')
+    parser.add_argument('--cutoffs', action='append', type=parseCutoffs, default=[],
+                        help='six comma-separated dollar amounts (can be repeated)')
+    parser.add_argument('--scale', type=float, nargs='*', default=[],
+                        help='also try the current cutoffs multiplied by each of these')
+    parser.add_argument('--csv', help='write every count here')
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args()
+    vectors = [cc.costCutoffs] + args.cutoffs + [scaledCutoffs(s) for s in args.scale]
+
+    fg = generateData.FileGenerator(useCache=not args.no_cache)
+    cutoffSweep = CutoffSweep(cc.FilterEngine.forRows(fg.r))
+    results = cutoffSweep.sweep(vectors)
+    if args.csv:
+        cutoffSweep.writeCSV(args.csv, vectors, results)
+    for cutoffs, counts in zip(vectors, results):
+        print("Cutoffs:", ' '.join(str(c) for c in cutoffs[1:]))
+        for (testType, level), tiers in sorted(cutoffSweep.summary(counts).items()):
+            print("  %s income level %d: %5d cheap %5d expensive %5d very expensive"
+                  % ((testType, level) + tiers))
@@ -11,10 +11,20 @@
 '''
 generates the HTML Files
 '''
-import locale
-locale.setlocale(locale.LC_ALL, 'en_US')
+import argparse
+import collections
+import concurrent.futures
+import gzip
+import hashlib
+import heapq
+import json
+import multiprocessing
+import os
+import string
 
 import collegeCosts as cc
+import profiling
+import scorecardYears
 
 states = {
         'AK': 'Alas[ka]',
@@ -105,33 +115,238 @@ actRanges = [(2, 18, "ACT 25th percentile: 17 or below"),
 
 
 
+class RangeLines:
+    '''
+    The lines for one score range of one income level and test type, as made by
+    FileGenerator.generateOneTestRange and shared by the pages for every state.
+    
+    A line is either a string, which goes on every page, or, for a public school,
+    a tuple of (text before the marker, state, text after the marker), which goes only
+    on its own state's page and the all-US page.  byState indexes those by state.
+    '''
+    def __init__(self, lines):
+        self.lines = [(line, None, '') if isinstance(line, str) else line for line in lines]
+        self.everyPage = []
+        self.byState = {}
+        for i, (unused_text, stateAbbr, unused_after) in enumerate(self.lines):
+            if stateAbbr is None:
+                self.everyPage.append(i)
+            else:
+                self.byState.setdefault(stateAbbr, []).append(i)
+
+    def render(self, stateAbbr, mark):
+        '''
+        The text for stateAbbr's page, or the all-US page if stateAbbr is None.  mark goes
+        in place of the public school marker, followed by the state on the all-US page.
+        '''
+        if stateAbbr is None:
+            picked = self.lines
+        else:
+            lines = self.lines
+            picked = [lines[i] for i in heapq.merge(self.everyPage, self.byState.get(stateAbbr, ()))]
+        out = []
+        for text, lineState, after in picked:
+            if lineState is None:
+                out.append(text)
+            elif stateAbbr is None:
+                out.append(text + mark + lineState + after)
+            else:
+                out.append(text + mark + after)
+        return '\n'.join(out)
+
+
 class FileGenerator:
     yearStr = '2022'
     outdir = 'data/'
     dataTemplateFile = 'dataTemplate.html'
     markPub = '*Pub:'
+    manifestVersion = 1  # change if the pages would come out differently for the same inputs
+    historicalYears = ('2016',)  # for pre-Covid SAT scores, newest first is tried first
+    writeBufferSize = 1 << 16
+    gzipSuffix = '.gz'
 
-    def __init__(self):
-        self.r = cc.readFile()
+    def __init__(self, useCache=True):
+        self.history = scorecardYears.ScorecardYears(self.historicalYears, useCache=useCache)
+        # this year's file and the newest historical one (which linkHistory always needs
+        # first) are read at the same time; older ones are left for linkHistory to load
+        # only if schools are still missing SAT scores.
+        newest = sorted(self.history.years, reverse=True)[:1]
+        tables = cc.readFiles([(self.history.fileName(self.yearStr), cc.pipelineColumns)]
+                              + self.history.files(newest), useCache=useCache)
+        self.r = tables[0]
+        self.history.addTables(zip(newest, tables[1:]))
         self.template = "{dataGoesHere}"
         self.quiet = False
         self.cachedInfo = {}
+        self.linkCache = {}  # (unitid, incomeLevel, testType) -> oneLinkParts()
+        self.buckets = None
+        self.templateHash = None
+        self.manifest = {}
+        self.force = False  # if True, write every page even if the manifest says it is current
+        self.pageCounts = collections.Counter()  # 'written', 'unchanged', 'skipped'
+        self.profileFile = None  # where generateAll saves the profile, if profiling is enabled
+        self.templateParts = []
+        self.unsyncedWrites = False
+        self.compress = False  # if True, also write a .html.gz of each page
+        self.gzipStats = collections.Counter()  # 'pages', 'bytesIn', 'bytesOut'
+        self._gzipPool = None
+        self._gzipJobs = []
 
-        historical_data = cc.readFile('college_data_2016.csv.gz')
-        historical_by_id = {sch.unitid: sch for sch in historical_data}
-        for sch in self.r:
-            if sch.unitid in historical_by_id:
-                old_data = historical_by_id[sch.unitid]
-                if sch.satvrmid is None and old_data.satvrmid is not None:
-                    # get older SAT data for this school
-                    # print(sch)
-                    sch.historical_data = old_data
+        self.history.linkHistory(self.r)
         
         self.getTemplate()
         
     def getTemplate(self):
         with open(self.dataTemplateFile) as dtf:
             self.template = ''.join(dtf.readlines())
+        self.templateHash = hashlib.sha256(self.template.encode('utf-8')).hexdigest()
+        # (literal text, field name or None, format spec, conversion), as str.format sees it
+        self.templateParts = list(string.Formatter().parse(self.template))
+
+    def pageParts(self, fields):
+        '''
+        Yields the pieces of self.template.format(**fields) in order without joining
+        them.  A field's value can also be a list of strings, which are yielded one by one.
+        '''
+        formatter = string.Formatter()
+        for literal, fieldName, formatSpec, conversion in self.templateParts:
+            if literal:
+                yield literal
+            if fieldName is None:
+                continue
+            value = fields[fieldName]
+            if isinstance(value, list):
+                yield from value
+            elif formatSpec or conversion:
+                yield formatter.format_field(formatter.convert_field(value, conversion),
+                                             formatSpec)
+            else:
+                yield str(value)
+
+    def writePage(self, outFilePath, pieces):
+        '''
+        Writes pieces to outFilePath through a buffer into a temporary file, which is
+        then moved into place, so that a page is never seen half-written.
+        The directory is synced later, once per batch, by syncOutdir().
+        '''
+        tmpPath = outFilePath + '.tmp'
+        with open(tmpPath, 'w', encoding='utf-8', buffering=self.writeBufferSize) as ofp:
+            ofp.writelines(pieces)
+        os.replace(tmpPath, outFilePath)
+        self.unsyncedWrites = True
+
+    def queueGzip(self, outFilePath, pieces=None):
+        '''
+        Compresses the page at outFilePath (from pieces if given, otherwise from the file)
+        to outFilePath + '.gz' in a background thread, so that it goes on while the
+        next pages are made.  finishBatch() waits for it and notes the size in the manifest.
+        '''
+        if self._gzipPool is None:  # made here, after any fork, not in __init__
+            self._gzipPool = concurrent.futures.ThreadPoolExecutor(os.cpu_count() or 1)
+        self._gzipJobs.append((outFilePath,
+                               self._gzipPool.submit(self._writeGzip, outFilePath, pieces)))
+
+    def _writeGzip(self, outFilePath, pieces):
+        '''
+        Writes the maximally compressed .gz of a page, with no name or time in its header
+        so that the same page always gives the same bytes.  Returns (page bytes, .gz bytes).
+        '''
+        if pieces is None:
+            with open(outFilePath, 'rb') as f:
+                data = f.read()
+        else:
+            data = ''.join(pieces).encode('utf-8')
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        gzipPath = outFilePath + self.gzipSuffix
+        tmpPath = gzipPath + '.tmp'
+        with open(tmpPath, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmpPath, gzipPath)
+        self.unsyncedWrites = True
+        return len(data), len(compressed)
+
+    def removeGzip(self, outFilePath):
+        '''
+        Deletes the page's .gz from an earlier run, if any, so that a server
+        looking for precompressed pages never sends an old version of a rewritten page.
+        '''
+        try:
+            os.remove(outFilePath + self.gzipSuffix)
+        except FileNotFoundError:
+            return
+        self.unsyncedWrites = True
+
+    def gzipIsCurrent(self, outFilePath):
+        '''
+        True if the page's .gz is the one written for its current manifest entry.
+        '''
+        entry = self.manifest.get(outFilePath)
+        if entry is None or 'gzip' not in entry:
+            return False
+        try:
+            return os.path.getsize(outFilePath + self.gzipSuffix) == entry['gzip']
+        except OSError:
+            return False
+
+    def finishBatch(self):
+        '''
+        Waits for the queued .gz files, records them in the manifest and gzipStats,
+        and syncs the output directory.
+        '''
+        for outFilePath, job in self._gzipJobs:
+            pageBytes, gzipBytes = job.result()
+            self.manifest[outFilePath] = dict(self.manifest[outFilePath], gzip=gzipBytes)
+            self.gzipStats['pages'] += 1
+            self.gzipStats['bytesIn'] += pageBytes
+            self.gzipStats['bytesOut'] += gzipBytes
+        self._gzipJobs = []
+        self.syncOutdir()
+
+    def syncOutdir(self):
+        '''
+        If any pages were written since the last call, fsync the output directory so that
+        their renames are on disk.  Skipped where directories cannot be opened (Windows).
+        '''
+        if not self.unsyncedWrites:
+            return
+        self.unsyncedWrites = False
+        try:
+            fd = os.open(self.outdir, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def manifestPath(self):
+        return self.outdir + 'manifest_' + self.yearStr + '.json'
+
+    def loadManifest(self):
+        '''
+        Reads the manifest of what generateAll last wrote: for each page, a hash of what
+        went into it (its year, the template, and the text of its score ranges), a hash of
+        the page itself, and the file's size (to notice pages changed by hand).
+        A missing or unreadable manifest is just empty.
+        '''
+        try:
+            with open(self.manifestPath(), encoding='utf-8') as mf:
+                manifest = json.load(mf)
+        except (OSError, ValueError):
+            manifest = {}
+        if manifest.get('version') != self.manifestVersion:
+            manifest = {}
+        self.manifest = manifest.get('pages', {})
+
+    def saveManifest(self):
+        manifestPath = self.manifestPath()
+        tmpPath = manifestPath + '.tmp'
+        with open(tmpPath, 'w', encoding='utf-8') as mf:
+            json.dump({'version': self.manifestVersion, 'pages': self.manifest},
+                      mf, indent=1, sort_keys=True)
+        os.replace(tmpPath, manifestPath)
     
     def outFilePath(self, incomeLevel, stateAbbr, testType='SAT'):
         stateAbbrStr = str(stateAbbr) # for "None"
@@ -141,7 +356,84 @@ class FileGenerator:
                                                             incomeLevel) + testType + '.html'
         return outfp
 
+    def datasetPath(self):
+        return self.outdir + 'schools_' + self.yearStr + '.json'
+
+    def exportDataset(self):
+        '''
+        Writes everything that oneLink shows about every school that can be on a page,
+        as one compact JSON file (datasetPath()) for filtering in the browser instead of
+        the static pages.
+
+        The data is by column, each a list with one entry per school in order of unitid:
+        unitid is delta-encoded (the first one, then the differences), state is a position in
+        the "states" list (or null), public and satEstimated are 0/1, gradRate is a whole percent,
+        and sat, act, and cost1 to cost5 are numbers or null.  Returns the number of schools.
+        '''
+        engine = cc.FilterEngine.forRows(self.r)
+        levels = (1, 2, 3, 4, 5)
+        costs = {level: engine.costs(level) for level in levels}
+        found = [i for i in engine.eligible
+                 if any(costs[level][i] is not None for level in levels)]
+        found.sort(key=lambda i: engine.schools[i].unitid)
+        schools = [engine.schools[i] for i in found]
+
+        unitids = [sch.unitid for sch in schools]
+        stateCodes = sorted({engine.states[i] for i in found} - {None})
+        statePosition = {s: p for p, s in enumerate(stateCodes)}
+        dataset = {'version': 1,
+                   'year': self.yearStr,
+                   'count': len(schools),
+                   'states': stateCodes,
+                   'unitid': [u - previous for u, previous in zip(unitids, [0] + unitids)],
+                   'name': [sch.shortName(30) for sch in schools],
+                   'state': [statePosition.get(engine.states[i]) for i in found],
+                   'public': [int(sch.isPublic) for sch in schools],
+                   'gradRate': [int(sch.gradRate * 100) for sch in schools],
+                   'sat': [engine.scores['SAT'][i] for i in found],
+                   'satEstimated': [int(engine.estimated['SAT'][i]) for i in found],
+                   'act': [engine.scores['ACT'][i] for i in found],
+                   }
+        for level in levels:
+            dataset['cost%d' % level] = [costs[level][i] for i in found]
+
+        outPath = self.datasetPath()
+        tmpPath = outPath + '.tmp'
+        with open(tmpPath, 'w', encoding='utf-8') as f:
+            json.dump(dataset, f, separators=(',', ':'))
+        os.replace(tmpPath, outPath)
+        return len(schools)
+
     def oneLink(self, row, incomeLevel=5, testType='SAT'):
+        text, stateAbbr = self.oneLinkParts(row, incomeLevel, testType)
+        if stateAbbr is None:
+            return text
+        return text + self.markPub + stateAbbr
+
+    def oneLinkParts(self, row, incomeLevel=5, testType='SAT'):
+        '''
+        Returns oneLink() without the public school marker (which is at the very end) and
+        the school's state if it is public, or the whole line and None if it is private.
+        '''
+        return self.linkParts([row], incomeLevel, testType)[0]
+
+    def linkParts(self, rows, incomeLevel=5, testType='SAT'):
+        '''
+        oneLinkParts for each of rows.  Each school's line for an income level and test type
+        is the same on every page, so it is made only the first time it is asked for
+        and kept in self.linkCache.  Costs are formatted with commas by format() rather
+        than locale (the pages always use US-style commas).
+        '''
+        cache = self.linkCache
+        keys = [(row.unitid, incomeLevel, testType) for row in rows]
+        missing = [(key, row) for key, row in zip(keys, rows) if key not in cache]
+        if missing:
+            costStrs = [format(int(row.cost(incomeLevel)), ',d') for unused_key, row in missing]
+            for (key, row), costStr in zip(missing, costStrs):
+                cache[key] = self._renderLink(row, costStr, testType)
+        return [cache[key] for key in keys]
+
+    def _renderLink(self, row, costStr, testType):
         pub = ""
         if row.isPublic:
             pub = self.markPub + row.STABBR
@@ -154,15 +446,52 @@ class FileGenerator:
         else:
             testScore = row.act25
         
-        costStr = locale.format_string("%d", row.cost(incomeLevel), grouping=True)
         scoreStr = ('~' if testIsEstimated else '') + str(testScore)
         out = ("  $%7s   %5s    %3d%% %7s" % 
               (costStr, scoreStr, int(row.gradRate*100), pub))
         out = ('<a target=_new href="https://collegescorecard.ed.gov/school/?%d">%30s</a>  %s' %
                (row.unitid, shortName, out))
-        return out
+        if not pub:
+            return out, None
+        return out[:len(out) - len(pub)], row.STABBR
     
 
+    def partitionSchools(self):
+        '''
+        Puts every school into its bucket for each test type, score range in satRanges or
+        actRanges, and income level in one pass over the schools (see cc.FilterEngine.partition),
+        each bucket split into cheap, more expensive, and very expensive schools.
+        '''
+        engine = cc.FilterEngine.forRows(self.r)
+        rangesByTest = {'SAT': satRanges, 'ACT': actRanges}
+        schools = engine.schools
+        self.buckets = {}
+        for (testType, band, level), found in engine.partition(rangesByTest).items():
+            testData = rangesByTest[testType][band]
+            self.buckets[(testType, testData, level)] = tuple(
+                [schools[i] for i in tier] for tier in engine.costTiers(found, level))
+
+    def costTiers(self, incomeLevel, testData, testType='SAT'):
+        '''
+        Returns three lists of schools in the testData range sorted by cost at incomeLevel:
+        those below the cost level, those only below the extreme cost level, and the rest.
+        '''
+        if self.buckets is None:
+            self.partitionSchools()
+        key = (testType, testData, incomeLevel)
+        if key in self.buckets:
+            return self.buckets[key]
+
+        testMin, testMax, unused_testExplain = testData  # not one of the standard ranges
+        if testType == 'SAT':
+            rOut = cc.filterRows(self.r, satMin=testMin, satMax=testMax, costLevel=incomeLevel)
+        else:
+            rOut = cc.filterACTRows(self.r, actMin=testMin, actMax=testMax, costLevel=incomeLevel)
+        return ([rr for rr in rOut if rr.belowCostLevel(incomeLevel)],
+                [rr for rr in rOut if not rr.belowCostLevel(incomeLevel)
+                                        and rr.belowExtremeCostLevel(incomeLevel)],
+                [rr for rr in rOut if not rr.belowExtremeCostLevel(incomeLevel)])
+
     def generateOneTestHeader(self, incomeLevel, testExplain):
         '''
         this used to be complex enough to warrant its own method...
@@ -179,26 +508,12 @@ class FileGenerator:
         out.append("<pre class='cost'>")
         if testType == 'SAT':
             out.append("<b>                                         Cost     SAT     Grad            </b>")
-            rOut = cc.filterRows(self.r, 
-                     satMin=testMin, 
-                     satMax=testMax, 
-                     costMax=None, 
-                     costLevel=incomeLevel,
-                     )
-
         elif testType == 'ACT':
             out.append("<b>                                         Cost     ACT     Grad            </b>")
-            rOut = cc.filterACTRows(self.r, 
-                                 actMin=testMin, 
-                                 actMax=testMax, 
-                                 costMax=None, 
-                                 costLevel=incomeLevel,
-                                 )
-        
         
-        for rr in rOut:
-            if rr.belowCostLevel(incomeLevel):
-                out.append(self.oneLink(rr, incomeLevel, testType))
+        cheap, expensive, veryExpensive = self.costTiers(incomeLevel, testData, testType)
+        for parts in self.linkParts(cheap, incomeLevel, testType):
+            out.append(parts + ('',))
         
         out.append("</pre>")
         
@@ -208,44 +523,31 @@ class FileGenerator:
                     str(incomeLevel) + "_" + str(testMin) + "'>Show More Expensive</button>")
         moreExpensive.append('<pre class="cost hiddenPre" id="pre' + str(incomeLevel) + "_" + 
                              str(testMin) + '">')
-        for rr in rOut:
-            if not rr.belowCostLevel(incomeLevel) and rr.belowExtremeCostLevel(incomeLevel):
-                moreExpensive.append(self.oneLink(rr, incomeLevel, testType))
-                moreExpensiveExists = True
-            elif not rr.belowExtremeCostLevel(incomeLevel):
-                moreExpensive.append("<span class='danger'>" + self.oneLink(rr, incomeLevel, testType) + "</span>")
-                moreExpensiveExists = True
+        for parts in self.linkParts(expensive, incomeLevel, testType):
+            moreExpensive.append(parts + ('',))
+            moreExpensiveExists = True
+        for text, stateAbbr in self.linkParts(veryExpensive, incomeLevel, testType):
+            if stateAbbr is None:
+                moreExpensive.append("<span class='danger'>" + text + "</span>")
+            else:
+                moreExpensive.append(("<span class='danger'>" + text, stateAbbr, "</span>"))
+            moreExpensiveExists = True
         moreExpensive.append("</pre>")
         
         if moreExpensiveExists:
             out.extend(moreExpensive)        
         out.append("&nbsp;<br>&nbsp;<br>&nbsp;<br>")
         
-        return out
+        return RangeLines(out)
 
     def stateFilteredTestRange(self, incomeLevel, stateAbbr, testData, testType='SAT'):
         cacheKey = (incomeLevel, testData, testType)
-        if cacheKey in self.cachedInfo:
-            allRows = self.cachedInfo[cacheKey][:]
-        else:
-            allRows = self.generateOneTestRange(incomeLevel, testData, testType)
-            self.cachedInfo[cacheKey] = allRows[:]
-        
-        filteredRows = []
-        stateMark = ""
-        if stateAbbr is not None:
-            stateMark = self.markPub + stateAbbr
-        for r in allRows:
-            if stateAbbr is not None and self.markPub in r and stateMark not in r:
-                continue
-            if stateAbbr is not None and stateMark in r:
-                r = r.replace(stateMark, '(publ.)')
-            elif stateAbbr is None and self.markPub in r:
-                r = r.replace(self.markPub, '    *')
-                
-            filteredRows.append(r)
-
-        return '\n'.join(filteredRows)
+        if cacheKey not in self.cachedInfo:
+            self.cachedInfo[cacheKey] = self.generateOneTestRange(incomeLevel, testData, testType)
+        rangeLines = self.cachedInfo[cacheKey]
+        if stateAbbr is None:
+            return rangeLines.render(None, '    *')
+        return rangeLines.render(stateAbbr, '(publ.)')
         
     
     def generateOneFile(self, incomeLevel=1, stateAbbr='', testType='SAT'):
@@ -263,26 +565,194 @@ class FileGenerator:
             oneRangeStr = self.stateFilteredTestRange(incomeLevel, stateAbbr, testData, testType)
             allRanges.append(oneRangeStr)
         
-        allAllStr = '\n'.join(allRanges)
+        inputsHash = hashlib.sha256()
+        for part in [self.yearStr, self.templateHash, outFilePath] + allRanges:
+            inputsHash.update(part.encode('utf-8') + b'\0')
+        inputsHash = inputsHash.hexdigest()
+        previous = self.manifest.get(outFilePath)
+        try:
+            current = previous is not None and os.path.getsize(outFilePath) == previous['size']
+        except OSError:  # no file
+            current = False
+        if not self.force and current and previous['inputs'] == inputsHash:
+            self.pageCounts['skipped'] += 1
+            if self.compress and not self.gzipIsCurrent(outFilePath):
+                self.queueGzip(outFilePath)
+            return
+        
+        dataGoesHere = []
+        for oneRangeStr in allRanges:
+            dataGoesHere.extend((oneRangeStr, '\n'))
+        dataGoesHere = dataGoesHere[:-1]
         abbrevNice = stateAbbr
         if abbrevNice is None:
             abbrevNice = 'All US'
-        writeOut = self.template.format(dataGoesHere=allAllStr,
-                                        stateAbbr=abbrevNice,
-                                        stateName=stateNames[stateAbbr],
-                                        incomeLevel=cc.incomeLevels[incomeLevel])
-        with open(outFilePath, 'w', encoding='utf-8') as ofp:
-            ofp.write(writeOut)
+        pieces = list(self.pageParts({'dataGoesHere': dataGoesHere,
+                                      'stateAbbr': abbrevNice,
+                                      'stateName': stateNames[stateAbbr],
+                                      'incomeLevel': cc.incomeLevels[incomeLevel]}))
+        contentHash = hashlib.sha256()
+        for piece in pieces:
+            contentHash.update(piece.encode('utf-8'))
+        contentHash = contentHash.hexdigest()
+        if not self.force and current and previous['content'] == contentHash:
+            self.manifest[outFilePath] = dict(previous, inputs=inputsHash)
+            self.pageCounts['unchanged'] += 1
+            if self.compress and not self.gzipIsCurrent(outFilePath):
+                self.queueGzip(outFilePath, pieces)
+            return
+        self.writePage(outFilePath, pieces)
+        self.manifest[outFilePath] = {'inputs': inputsHash,
+                                      'content': contentHash,
+                                      'size': os.path.getsize(outFilePath),
+                                      }
+        self.pageCounts['written'] += 1
+        if self.compress:
+            self.queueGzip(outFilePath, pieces)
+        else:
+            self.removeGzip(outFilePath)
     
     
-    def generateAll(self):
+    def pageList(self):
+        '''
+        The (incomeLevel, stateAbbr, testType) of every page that generateAll makes, in order,
+        each only once (a few states are in cc.stateList twice).
+        '''
+        pages = []
         for testType in ('ACT', 'SAT'):
             for incomeLevel in range(1, 6):
                 for stateAbbr in cc.stateList:
-                    self.generateOneFile(incomeLevel, stateAbbr, testType)
+                    pages.append((incomeLevel, stateAbbr, testType))
+        return list(dict.fromkeys(pages))
+
+    def generateAll(self, jobs=1):
+        '''
+        Write every page.  If jobs is more than 1 (0 = one per CPU), the pages are
+        divided up by test type and income level among that many worker processes.
+        The workers are forked after the schools are loaded and partitioned,
+        so they share that work rather than repeating it.  Each page is written by
+        exactly one worker, so the output is the same as with one job.
+        
+        Where processes cannot be forked (Windows) the pages are made one at a time.
+        
+        Pages whose inputs have not changed since the last run (according to the manifest)
+        are skipped, and pages that come out the same as before are not rewritten,
+        unless self.force is True.
+        
+        If self.compress is True, each page also gets a .html.gz copy (made for pages
+        written this time, or whose copy is missing or out of date).
+        
+        If profiling is enabled and self.profileFile is set, the profile (including the
+        workers') is saved there at the end.
+        '''
+        self.loadManifest()
+        self.pageCounts.clear()
+        self.gzipStats.clear()
+        self._generatePages(jobs)
+        self.saveManifest()
+        if profiling.enabled and self.profileFile is not None:
+            profiling.dump(self.profileFile)
+        if self.quiet is not True:
+            print("%d pages written, %d unchanged, %d skipped (inputs unchanged)" %
+                  (self.pageCounts['written'], self.pageCounts['unchanged'],
+                   self.pageCounts['skipped']))
+            if self.compress:
+                bytesIn = self.gzipStats['bytesIn']
+                saved = bytesIn - self.gzipStats['bytesOut']
+                print("%d pages compressed, %d bytes saved (%.1f%%)" %
+                      (self.gzipStats['pages'], saved, 100 * saved / bytesIn if bytesIn else 0))
+
+    def _generatePages(self, jobs):
+        pages = self.pageList()
+        if jobs == 0:
+            jobs = os.cpu_count() or 1
+        if jobs <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            for incomeLevel, stateAbbr, testType in pages:
+                self.generateOneFile(incomeLevel, stateAbbr, testType)
+            self.finishBatch()
+            return
+
+        if self.buckets is None:
+            self.partitionSchools()
+        groups = {}
+        for page in pages:
+            incomeLevel, unused_stateAbbr, testType = page
+            groups.setdefault((testType, incomeLevel), []).append(page)
+
+        global _workerGenerator
+        _workerGenerator = self
+        try:
+            with multiprocessing.get_context('fork').Pool(jobs) as pool:
+                results = pool.imap_unordered(_generatePageGroup, groups.values())
+                for done, result in enumerate(results, 1):
+                    (worker, testType, incomeLevel, manifestEntries, pageCounts, gzipStats,
+                     profile) = result
+                    self.manifest.update(manifestEntries)
+                    self.pageCounts.update(pageCounts)
+                    self.gzipStats.update(gzipStats)
+                    if profile is not None:
+                        profiling.merge(profile)
+                    if self.quiet is not True:
+                        print("[%d/%d] %s made %d %s pages for income level %d" %
+                              (done, len(groups), worker, sum(pageCounts.values()),
+                               testType, incomeLevel))
+        finally:
+            _workerGenerator = None
+
+
+_workerGenerator = None  # the FileGenerator that forked worker processes inherit
+
+def _generatePageGroup(pages):
+    '''
+    Runs in a worker process: writes pages (all of one test type and income level, so
+    that the cached ranges get reused) with the inherited FileGenerator, and sends back
+    their manifest entries, counts, compression totals, and (if profiling) profile.
+    '''
+    fg = _workerGenerator
+    fg.quiet = True
+    fg.pageCounts = collections.Counter()
+    fg.gzipStats = collections.Counter()
+    if profiling.enabled:
+        profiling.reset()  # only send back what this worker did
+    for incomeLevel, stateAbbr, testType in pages:
+        fg.generateOneFile(incomeLevel, stateAbbr, testType)
+    fg.finishBatch()
+    manifestEntries = {}
+    for incomeLevel, stateAbbr, testType in pages:
+        outFilePath = fg.outFilePath(incomeLevel, stateAbbr, testType)
+        if outFilePath in fg.manifest:
+            manifestEntries[outFilePath] = fg.manifest[outFilePath]
+    incomeLevel, unused_stateAbbr, testType = pages[0]
+    return (multiprocessing.current_process().name, testType, incomeLevel,
+            manifestEntries, fg.pageCounts, fg.gzipStats,
+            profiling.snapshot() if profiling.enabled else None)
+
             
 if __name__ == '__main__':
-    fg = FileGenerator()
-    fg.generateAll()
+    parser = argparse.ArgumentParser(description='Generate the College Costs pages.')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='number of worker processes (0 = one per CPU)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='parse the .csv.gz files without using or writing the parse cache')
+    parser.add_argument('--force', action='store_true',
+                        help='write every page, even those the manifest says are current')
+    parser.add_argument('--export', action='store_true',
+                        help='write the compact dataset for the browser instead of the pages')
+    parser.add_argument('--gzip', action='store_true',
+                        help='also write a precompressed .html.gz next to each page')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='time each stage and save the results to FILE as JSON')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='with --profile, also trace peak memory (slower)')
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable(memory=args.profile_memory)
+    fg = FileGenerator(useCache=not args.no_cache)
+    fg.profileFile = args.profile
+    if args.export:
+        print("%d schools written to %s" % (fg.exportDataset(), fg.datasetPath()))
+    else:
+        fg.force = args.force
+        fg.compress = args.gzip
+        fg.generateAll(jobs=args.jobs)
     #fg.generateOneFile(2, None)
-            
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:         parseCache.py
+# Purpose:      Binary cache of parsed Scorecard files
+#
+# Authors:      Michael Scott Asato Cuthbert
+#
+# Copyright:    Copyright © 2016-23 Michael Scott Asato Cuthbert
+# License:      MIT, see LICENSE file
+#-------------------------------------------------------------------------------
+'''
+Keeps a binary copy of the columns that collegeCosts.readFile parsed from a
+.csv.gz file next to it (college_data_2022.csv.gz.cache), so that later runs can skip
+gunzipping and parsing.  Each list of columns asked for gets its own cache file
+(college_data_2016.csv.gz.1f0c55e2a4b3.cache), so that callers reading different
+columns of the same file do not keep replacing each other's cache.
+
+Numeric columns and null masks are stored as raw machine arrays and loaded as
+memoryviews straight onto the mmap-ed cache file, so nothing is copied.
+Text columns are stored as a list of distinct strings plus an array of codes.
+
+The cache is only used if the source file has the same size and either the
+same mtime or the same sha256 hash as when the cache was written, and if it was
+written for the same list of columns.
+'''
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'collegeCosts parse cache\n'
+VERSION = 3
+cacheSuffix = '.cache'
+
+
+def cachePath(fn, columns=None):
+    '''
+    The cache file for fn read with these columns; all columns (None) get fn + '.cache'.
+    '''
+    key = columnsKey(columns)
+    if key is None:
+        return fn + cacheSuffix
+    digest = hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()[:12]
+    return fn + '.' + digest + cacheSuffix
+
+
+def fileHash(fn):
+    h = hashlib.sha256()
+    with open(fn, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def sourceInfo(fn):
+    '''
+    The size, mtime, and hash of fn that a cache is keyed on.
+    '''
+    st = os.stat(fn)
+    return {'size': st.st_size, 'mtime': st.st_mtime_ns, 'sha256': fileHash(fn)}
+
+
+def columnsKey(columns):
+    if columns is None:
+        return None
+    return sorted({c.lower() for c in columns})
+
+
+def load(fn, columns=None):
+    '''
+    Returns (header, columnData) from the cache for fn, or None if there is no
+    cache or it is out of date or was written for different columns.
+
+    columnData has one (kind, values, nulls, length, oddCount, oddExamples) tuple per
+    column in header, ready for collegeCosts.Column.fromStorage.
+    '''
+    try:
+        with open(cachePath(fn, columns), 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # ValueError: empty file
+        return None
+
+    try:
+        meta, dataStart = _readMeta(mm)
+        if not _isCurrent(meta, fn, columns):
+            return None
+        return meta['header'], _columnData(meta, memoryview(mm)[dataStart:])
+    except (ValueError, TypeError, KeyError, struct.error):  # damaged: treat as stale
+        return None
+
+
+def _columnData(meta, data):
+    '''
+    The columnData for load(), raising ValueError if any section is not all in data
+    (a cache cut short, say).
+    '''
+    def section(place, itemsize=1):
+        start, length = place
+        if start < 0 or length < 0 or start + length > len(data) or length % itemsize:
+            raise ValueError('damaged parse cache')
+        return data[start:start + length]
+
+    columnData = []
+    for c in meta['columns']:
+        kind = c['kind']
+        length = c['length']
+        values = None
+        nulls = None
+        if kind in ('int', 'float'):
+            values = section(c['values'], 8).cast('q' if kind == 'int' else 'd')
+            nulls = section(c['nulls'])
+            if len(values) != length or len(nulls) != length:
+                raise ValueError('damaged parse cache')
+        elif kind == 'str':
+            strings = [sys.intern(s) for s in json.loads(bytes(section(c['strings'])))]
+            values = [None if code < 0 else strings[code]
+                      for code in section(c['values'], 4).cast('i')]
+            if len(values) != length:
+                raise ValueError('damaged parse cache')
+        columnData.append((kind, values, nulls, length, c['odd_count'], c['odd_examples']))
+    return columnData
+
+
+def _readMeta(mm):
+    if mm[:len(MAGIC)] != MAGIC:
+        raise ValueError('not a parse cache')
+    start = len(MAGIC)
+    (metaLength,) = struct.unpack('<Q', mm[start:start + 8])
+    start += 8
+    meta = json.loads(mm[start:start + metaLength])
+    return meta, _align(start + metaLength)
+
+
+def _isCurrent(meta, fn, columns):
+    if (meta.get('version') != VERSION
+            or meta.get('byteorder') != sys.byteorder
+            or meta.get('columns_requested') != columnsKey(columns)):
+        return False
+    try:
+        st = os.stat(fn)
+    except OSError:
+        return False
+    source = meta['source']
+    if st.st_size != source['size']:
+        return False
+    if st.st_mtime_ns == source['mtime']:
+        return True
+    # touched (say by a fresh checkout) but maybe not changed.
+    return fileHash(fn) == source['sha256']
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def save(fn, columns, header, tableColumns, source=None):
+    '''
+    Writes the cache for fn.  tableColumns are the collegeCosts.Column objects
+    parsed from it (only with the named columns if columns is not None);
+    source is the sourceInfo(fn) taken before parsing (or now if None).
+
+    The cache is written to a temporary file and moved into place.  Failing to write
+    it (a read-only directory, say) is not an error.
+    '''
+    if source is None:
+        source = sourceInfo(fn)
+    sections = []
+    offset = 0
+
+    def addSection(buf):
+        nonlocal offset
+        buf = memoryview(buf).cast('B')
+        place = [offset, buf.nbytes]
+        sections.append(buf)
+        padding = _align(buf.nbytes) - buf.nbytes
+        if padding:
+            sections.append(b'\0' * padding)
+        offset += buf.nbytes + padding
+        return place
+
+    columnMeta = []
+    for column in tableColumns:
+        c = {'kind': column.kind,
+             'length': column.length,
+             'odd_count': column.oddCount,
+             'odd_examples': column.oddExamples,
+             }
+        if column.kind in ('int', 'float'):
+            c['values'] = addSection(column.values)
+            c['nulls'] = addSection(column.nulls)
+        elif column.kind == 'str':
+            codes = {}
+            codeArray = array.array('i', [-1 if v is None else codes.setdefault(v, len(codes))
+                                          for v in column.values])
+            c['values'] = addSection(codeArray)
+            c['strings'] = addSection(json.dumps(list(codes)).encode('utf-8'))
+        columnMeta.append(c)
+
+    meta = {'version': VERSION,
+            'byteorder': sys.byteorder,
+            'source': source,
+            'columns_requested': columnsKey(columns),
+            'header': header,
+            'columns': columnMeta,
+            }
+    metaBytes = json.dumps(meta).encode('utf-8')
+    prefix = MAGIC + struct.pack('<Q', len(metaBytes)) + metaBytes
+    prefix += b'\0' * (_align(len(prefix)) - len(prefix))
+
+    outPath = cachePath(fn, columns)
+    tmpPath = outPath + '.tmp%d' % os.getpid()
+    try:
+        with open(tmpPath, 'wb') as f:
+            f.write(prefix)
+            for buf in sections:
+                f.write(buf)
+        os.replace(tmpPath, outPath)
+    except OSError:
+        try:
+            os.remove(tmpPath)
+        except OSError:
+            pass
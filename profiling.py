@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:         profiling.py
+# Purpose:      Opt-in timing and memory use of each stage of making the pages
+#
+# Authors:      Michael Scott Asato Cuthbert
+#
+# Copyright:    Copyright © 2016-23 Michael Scott Asato Cuthbert
+# License:      MIT, see LICENSE file
+#-------------------------------------------------------------------------------
+'''
+Records, for each stage of the pipeline (reading files, the historical join, filtering,
+oneLink, rendering, making each page, writing files), how many times it ran, the total wall time, and
+(optionally) the peak memory Python allocated while it ran, plus how often
+SchoolTable.column() found its column in attrLookup.
+
+Nothing is measured until enable() is called, which wraps the functions listed in
+`stages` (so there is nothing extra to run when profiling is off):
+
+    import profiling
+    profiling.enable(memory=True)
+    ... generate pages ...
+    profiling.dump('profile.json')
+
+generateData.py --profile profile.json does this.  Times are inclusive, so
+'render' includes the 'oneLink' calls (batches of FileGenerator.linkParts) that it makes,
+and 'page' (all of one page: filling the template, hashing, writing) includes 'writePage'
+(just writing the .html file).  With --gzip, 'writeGzip' (compressing and writing the .gz)
+runs in background threads, alongside the pages that follow, so it is not part of 'page'.
+'''
+import collections
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# stage name -> (module name, class name or None, function name) of what is timed
+stages = {
+    'readFile': ('collegeCosts', None, 'readFile'),
+    'historyJoin': ('scorecardYears', 'ScorecardYears', 'linkHistory'),
+    'filterIndex': ('collegeCosts', 'FilterEngine', '__init__'),
+    'filter': ('collegeCosts', 'FilterEngine', 'selectIndices'),
+    'partition': ('collegeCosts', 'FilterEngine', 'partition'),
+    'oneLink': ('generateData', 'FileGenerator', 'linkParts'),
+    'render': ('generateData', 'FileGenerator', 'generateOneTestRange'),
+    'page': ('generateData', 'FileGenerator', 'generateOneFile'),
+    'writePage': ('generateData', 'FileGenerator', 'writePage'),
+    'writeGzip': ('generateData', 'FileGenerator', '_writeGzip'),
+}
+
+enabled = False
+trackMemory = False
+calls = collections.Counter()
+seconds = collections.defaultdict(float)
+peakBytes = collections.defaultdict(int)
+attrLookups = collections.Counter()  # 'hits' and 'misses'
+_openStages = []
+_originals = {}  # (owner, function name) -> original
+
+
+def _owner(moduleName, className):
+    module = sys.modules.get(moduleName)
+    if module is None:  # maybe it is being run as a script, like generateData.py
+        main = sys.modules.get('__main__')
+        mainFile = getattr(main, '__file__', None) or ''
+        if os.path.splitext(os.path.basename(mainFile))[0] != moduleName:
+            return None
+        module = main
+    if className is None:
+        return module
+    return getattr(module, className)
+
+
+def _notePeak():
+    '''
+    Credit the peak since the last reset to every stage still running, then reset it,
+    so that nested stages each get the right peak.
+    '''
+    peak = tracemalloc.get_traced_memory()[1]
+    for name in _openStages:
+        if peak > peakBytes[name]:
+            peakBytes[name] = peak
+    tracemalloc.reset_peak()
+
+
+def _timed(name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **keywords):
+        if trackMemory:
+            _notePeak()
+        _openStages.append(name)
+        start = time.perf_counter()
+        try:
+            return function(*args, **keywords)
+        finally:
+            seconds[name] += time.perf_counter() - start
+            calls[name] += 1
+            if trackMemory:
+                _notePeak()
+            _openStages.remove(name)
+    return wrapper
+
+
+def _countedColumn(column):
+    @functools.wraps(column)
+    def wrapper(self, attr):
+        attrLookups['hits' if attr in self.attrLookup else 'misses'] += 1
+        return column(self, attr)
+    return wrapper
+
+
+def _wrap(owner, functionName, wrapper):
+    original = owner.__dict__[functionName] if isinstance(owner, type) else getattr(
+        owner, functionName)
+    _originals[(owner, functionName)] = original
+    setattr(owner, functionName, wrapper(original))
+
+
+def enable(memory=False):
+    '''
+    Start recording (clearing anything recorded before).  Only stages whose module has
+    been imported are recorded, so import generateData etc. first.
+    If memory is True, peak memory is traced too, which makes everything run slower.
+    '''
+    global enabled, trackMemory
+    disable()
+    reset()
+    for name, (moduleName, className, functionName) in stages.items():
+        owner = _owner(moduleName, className)
+        if owner is not None:
+            _wrap(owner, functionName, functools.partial(_timed, name))
+    schoolTable = _owner('collegeCosts', 'SchoolTable')
+    if schoolTable is not None:
+        _wrap(schoolTable, 'column', _countedColumn)
+    trackMemory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    enabled = True
+
+
+def disable():
+    '''
+    Stop recording and put back the original functions.  What was recorded is kept.
+    '''
+    global enabled
+    for (owner, functionName), original in _originals.items():
+        setattr(owner, functionName, original)
+    _originals.clear()
+    if trackMemory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    enabled = False
+
+
+def reset():
+    calls.clear()
+    seconds.clear()
+    peakBytes.clear()
+    attrLookups.clear()
+
+
+def snapshot():
+    '''
+    What has been recorded so far, as a dict that can be given to merge() (say, from a
+    worker process) or saved as JSON.
+    '''
+    return {'stages': {name: {'calls': calls[name],
+                              'seconds': seconds[name],
+                              'peak_bytes': peakBytes[name] if trackMemory else None,
+                              }
+                       for name in stages if calls[name]},
+            'attr_lookups': {'hits': attrLookups['hits'], 'misses': attrLookups['misses']},
+            }
+
+
+def merge(other):
+    '''
+    Add the counts and times from another snapshot() into this process's.
+    '''
+    for name, stage in other['stages'].items():
+        calls[name] += stage['calls']
+        seconds[name] += stage['seconds']
+        if stage['peak_bytes'] is not None and stage['peak_bytes'] > peakBytes[name]:
+            peakBytes[name] = stage['peak_bytes']
+    attrLookups.update(other['attr_lookups'])
+
+
+def dump(fn):
+    '''
+    Write snapshot() to fn as JSON, along with the largest resident size of the process
+    (and of any finished worker processes) so far.
+    '''
+    profile = snapshot()
+    if resource is not None:
+        profile['max_rss_kb'] = {
+            'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        }
+    with open(fn, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, indent=1)
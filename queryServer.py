@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:         queryServer.py
+# Purpose:      Answer college cost queries as JSON over HTTP on localhost
+#
+# Authors:      Michael Scott Asato Cuthbert
+#
+# Copyright:    Copyright © 2016-23 Michael Scott Asato Cuthbert
+# License:      MIT, see LICENSE file
+#-------------------------------------------------------------------------------
+'''
+Loads the Scorecard data once and answers queries like
+
+    http://127.0.0.1:8765/query?test=SAT&min=1200&max=1300&level=1&costMax=20000&state=CA&gradMin=.6
+
+with the same schools that filterRows / filterACTRows would give (in the same order),
+less any below gradMin, as JSON.  Unlike filterRows, leaving out max still only gives
+schools scoring at least min.
+
+    http://127.0.0.1:8765/best?test=SAT&score=1250&within=50&k=10&level=1&gradMin=.6
+
+gives the k cheapest schools near a score instead (see cc.FilterEngine.bestValues).
+http://127.0.0.1:8765/metrics gives the number of queries, how long they took, and how
+often the cache of recent results was used.
+
+Only listens on 127.0.0.1:
+
+    python queryServer.py --port 8765
+'''
+import argparse
+import asyncio
+import collections
+import json
+import time
+import traceback
+import urllib.parse
+
+import collegeCosts as cc
+import scorecardYears
+
+
+class QueryError(ValueError):
+    pass
+
+
+class QueryServer(object):
+    '''
+    The data and the query logic; serve() runs the HTTP server.
+    '''
+    host = '127.0.0.1'
+    port = 8765
+    cacheSize = 256
+    latencySamples = 1000  # how many recent query times to keep for the percentiles
+    historicalYears = ('2016',)
+
+    def __init__(self, fn='college_data_2022.csv.gz', useCache=True):
+        self.table = cc.readFile(fn, columns=cc.pipelineColumns, useCache=useCache)
+        history = scorecardYears.ScorecardYears(self.historicalYears, useCache=useCache)
+        history.linkHistory(self.table)
+        self.engine = self.table.filterEngine()
+        self.results = collections.OrderedDict()  # LRU cache: query key -> response bytes
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.queryCount = 0
+        self.errorCount = 0
+        self.totalSeconds = 0.0
+        self.maxSeconds = 0.0
+        self.recentSeconds = collections.deque(maxlen=self.latencySamples)
+
+    @staticmethod
+    def parseQuery(params, path='/query'):
+        '''
+        Turns a dict of query string values into the arguments of query() (or of best(),
+        if path is '/best'), raising QueryError for anything that does not make sense.
+        '''
+        def number(name, default=None, kind=int):
+            value = params.get(name)
+            if value in (None, ''):
+                return default
+            try:
+                return kind(value)
+            except ValueError:
+                raise QueryError('%s must be a number, not %r' % (name, value))
+
+        testType = params.get('test', 'SAT').upper()
+        if testType not in ('SAT', 'ACT'):
+            raise QueryError('test must be SAT or ACT')
+        level = number('level', 1)
+        if level not in (1, 2, 3, 4, 5):
+            raise QueryError('level must be 1 to 5')
+        state = params.get('state') or None
+        if state is not None:
+            state = state.upper()
+        if path == '/best':
+            if not params.get('score'):
+                raise QueryError('score is required')
+            within = number('within', 50)
+            if within < 0:
+                raise QueryError('within cannot be negative')
+            k = number('k', 10)
+            if k < 1:
+                raise QueryError('k must be at least 1')
+            return (path, testType, number('score'), within, k, level, state,
+                    number('gradMin', None, float))
+        if params.get('min') == 'none':  # schools with no score
+            scoreMin = None
+        else:
+            scoreMin = number('min', 0)
+        scoreMax = number('max')
+        if scoreMax is None and scoreMin is not None:
+            # filterRows ignores satMin when satMax is None; here min still counts.
+            scoreMax = float('inf')
+        limit = number('limit')
+        if limit is not None and limit < 0:
+            raise QueryError('limit cannot be negative')
+        return (path, testType, scoreMin, scoreMax, number('costMax'), level, state,
+                number('gradMin', None, float), limit)
+
+    def query(self, testType='SAT', scoreMin=0, scoreMax=None, costMax=None, costLevel=1,
+              stateAbbr=None, gradMin=None, limit=None):
+        '''
+        The schools filterRows (or filterACTRows) would give for these arguments, with
+        only those with a graduation rate of at least gradMin (if given), at most
+        limit of them (if given), as a dict ready for JSON.
+        '''
+        engine = self.engine
+        found = engine.selectIndices(testType, scoreMin, scoreMax, costMax, costLevel, stateAbbr)
+        schools = [engine.schools[i] for i in found]
+        if gradMin is not None:
+            schools = [sch for sch in schools if sch.gradRate >= gradMin]
+        count = len(schools)
+        if limit is not None:
+            schools = schools[:limit]
+        return {'count': count, 'schools': self.describe(schools, testType, costLevel)}
+
+    def best(self, testType='SAT', score=1000, within=50, k=10, costLevel=1, stateAbbr=None,
+             gradMin=None):
+        '''
+        The k cheapest schools within `within` points of score; see cc.FilterEngine.bestValues.
+        '''
+        schools = self.engine.bestValues(score, within, k, costLevel, testType, gradMin,
+                                         stateAbbr)
+        return {'count': len(schools), 'schools': self.describe(schools, testType, costLevel)}
+
+    @staticmethod
+    def describe(schools, testType, costLevel):
+        out = []
+        for sch in schools:
+            if testType == 'SAT':
+                score, estimated = sch.sat25_data()
+            else:
+                score, estimated = sch.act25, False
+            out.append({'unitid': sch.unitid,
+                        'name': sch.shortName(30),
+                        'cost': sch.cost(costLevel),
+                        'score': score,
+                        'estimated': estimated,
+                        'gradRate': sch.gradRate,
+                        'state': sch.STABBR,
+                        'public': sch.isPublic,
+                        })
+        return out
+
+    def cachedQuery(self, args):
+        '''
+        query(*args[1:]) (or best(), if args[0] is '/best') as JSON bytes,
+        from the cache if it was asked recently.
+        '''
+        try:
+            body = self.results.pop(args)
+            self.cacheHits += 1
+        except KeyError:
+            self.cacheMisses += 1
+            answer = self.best if args[0] == '/best' else self.query
+            body = json.dumps(answer(*args[1:])).encode('utf-8')
+            if len(self.results) >= self.cacheSize:
+                self.results.popitem(last=False)
+        self.results[args] = body
+        return body
+
+    def metrics(self):
+        recent = sorted(self.recentSeconds)
+
+        def percentile(p):
+            if not recent:
+                return None
+            return recent[min(len(recent) - 1, int(p * len(recent)))] * 1000
+
+        return {'queries': self.queryCount,
+                'errors': self.errorCount,
+                'cache_hits': self.cacheHits,
+                'cache_misses': self.cacheMisses,
+                'cache_size': len(self.results),
+                'mean_ms': (self.totalSeconds / self.queryCount * 1000
+                            if self.queryCount else None),
+                'max_ms': self.maxSeconds * 1000,
+                'p50_ms': percentile(.5),
+                'p95_ms': percentile(.95),
+                }
+
+    def respond(self, target):
+        '''
+        Returns (status, body bytes) for a GET of target (path and query string).
+        '''
+        url = urllib.parse.urlsplit(target)
+        if url.path == '/metrics':
+            return 200, json.dumps(self.metrics()).encode('utf-8')
+        if url.path not in ('/query', '/best'):
+            return 404, b'{"error": "not found"}'
+
+        start = time.perf_counter()
+        try:
+            params = dict(urllib.parse.parse_qsl(url.query))
+            status, body = 200, self.cachedQuery(self.parseQuery(params, url.path))
+        except QueryError as qe:
+            self.errorCount += 1
+            status, body = 400, json.dumps({'error': str(qe)}).encode('utf-8')
+        except Exception:  # a bug; answer it and keep serving
+            traceback.print_exc()
+            self.errorCount += 1
+            status, body = 500, b'{"error": "internal error"}'
+        elapsed = time.perf_counter() - start
+        self.queryCount += 1
+        self.totalSeconds += elapsed
+        self.maxSeconds = max(self.maxSeconds, elapsed)
+        self.recentSeconds.append(elapsed)
+        return status, body
+
+    async def handle(self, reader, writer):
+        try:
+            requestLine = await reader.readline()
+            while True:  # skip the headers
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+            parts = requestLine.decode('latin-1').split()
+            if len(parts) < 2:
+                status, body = 400, b'{"error": "bad request"}'
+            elif parts[0] != 'GET':
+                status, body = 405, b'{"error": "only GET"}'
+            else:
+                status, body = self.respond(parts[1])
+            reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                      405: 'Method Not Allowed', 500: 'Internal Server Error'}[status]
+            writer.write(('HTTP/1.1 %d %s\r\n'
+                          'Content-Type: application/json\r\n'
+                          'Content-Length: %d\r\n'
+                          'Connection: close\r\n\r\n' % (status, reason, len(body))
+                          ).encode('latin-1') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, port=None):
+        server = await asyncio.start_server(self.handle, self.host, port or self.port)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve college cost queries on localhost.')
+    parser.add_argument('--port', type=int, default=QueryServer.port)
+    parser.add_argument('--no-cache', action='store_true',
+                        help='reparse the data files instead of using the parse cache')
+    args = parser.parse_args()
+    queryServer = QueryServer(useCache=not args.no_cache)
+    print('Serving on http://%s:%d/query' % (queryServer.host, args.port))
+    try:
+        asyncio.run(queryServer.serve(args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:         scorecardYears.py
+# Purpose:      Several years of Scorecard files, joined by unitid
+#
+# Authors:      Michael Scott Asato Cuthbert
+#
+# Copyright:    Copyright © 2016-23 Michael Scott Asato Cuthbert
+# License:      MIT, see LICENSE file
+#-------------------------------------------------------------------------------
+'''
+Loads any number of college_data_YYYY.csv.gz files, each only when it is first needed
+and only for the columns asked for, and lines them up by unitid.
+
+All the years share one sorted array of every unitid seen so far; each year has an array,
+parallel to it, giving the row in that year's table for each unitid (or -1).
+'''
+import array
+import bisect
+
+import collegeCosts as cc
+
+# what School.SAT and sat25_data need from an older year, plus the unitid to find it by.
+historyColumns = ['UNITID', 'SATVR25', 'SATVR75', 'SATMT25', 'SATMT75', 'SATVRMID', 'SATMTMID']
+
+
+class ScorecardYears:
+    '''
+    Scorecard files for several years.  Years are strings or ints like '2016'.
+    Only columns (default: historyColumns) are read from each file.
+    '''
+    fileTemplate = 'college_data_{year}.csv.gz'
+
+    def __init__(self, years, columns=None, useCache=True):
+        self.years = [str(y) for y in years]
+        if columns is None:
+            columns = historyColumns
+        self.columns = columns
+        self.useCache = useCache
+        self.tables = {}  # year -> SchoolTable, as loaded
+        self.unitids = array.array('q')  # sorted unitids from every loaded year
+        self.rowIndex = {}  # year -> array parallel to self.unitids of row numbers or -1
+
+    def fileName(self, year):
+        return self.fileTemplate.format(year=year)
+
+    def table(self, year):
+        '''
+        The SchoolTable for year, loading it (and adding it to the unitid index)
+        if this is the first time it is needed.
+        '''
+        year = str(year)
+        if year not in self.tables:
+            self.addTable(year, cc.readFile(self.fileName(year), columns=self.columns,
+                                            useCache=self.useCache))
+        return self.tables[year]
+
+    def files(self, years=None):
+        '''
+        (filename, columns) for each of years (default: self.years) not yet loaded,
+        as for cc.readFiles.
+        '''
+        if years is None:
+            years = self.years
+        return [(self.fileName(y), self.columns) for y in map(str, years)
+                if y not in self.tables]
+
+    def load(self, years=None):
+        '''
+        Load every one of years (default: self.years) not loaded yet, all at the same time.
+        '''
+        if years is None:
+            years = self.years
+        toLoad = [y for y in map(str, years) if y not in self.tables]
+        if toLoad:
+            self.addTables(zip(toLoad, cc.readFiles(self.files(toLoad), useCache=self.useCache)))
+
+    def addTable(self, year, table):
+        '''
+        Add an already-loaded table for year (which need not be in self.years) and rebuild
+        the unitid index to include it.
+        '''
+        self.addTables([(year, table)])
+
+    def addTables(self, yearTables):
+        '''
+        addTable for each (year, table) in yearTables, rebuilding the index once.
+        '''
+        for year, table in yearTables:
+            year = str(year)
+            self.tables[year] = table
+            if year not in self.years:
+                self.years.append(year)
+        unitidsByYear = {y: self._unitidColumn(t) for y, t in self.tables.items()}
+        allUnitids = set()
+        for yearUnitids in unitidsByYear.values():
+            allUnitids.update(u for u in yearUnitids if u is not None)
+        self.unitids = array.array('q', sorted(allUnitids))
+        position = {u: i for i, u in enumerate(self.unitids)}
+        self.rowIndex = {}
+        for y, yearUnitids in unitidsByYear.items():
+            rows = array.array('l', [-1]) * len(self.unitids)
+            for row, u in enumerate(yearUnitids):
+                if u is not None:
+                    rows[position[u]] = row  # last one wins if a unitid is in twice
+            self.rowIndex[y] = rows
+
+    @staticmethod
+    def _unitidColumn(table):
+        column = table.column('UNITID')
+        return [column[i] for i in range(len(column))]
+
+    def position(self, unitid):
+        '''
+        Where unitid is in self.unitids, or None.
+        '''
+        i = bisect.bisect_left(self.unitids, unitid)
+        if i < len(self.unitids) and self.unitids[i] == unitid:
+            return i
+        return None
+
+    def school(self, year, unitid):
+        '''
+        The School for unitid in year, or None if it is not in that year's file.
+        '''
+        table = self.table(year)
+        i = self.position(unitid)
+        if i is None:
+            return None
+        row = self.rowIndex[str(year)][i]
+        if row < 0:
+            return None
+        return table[row]
+
+    def linkHistory(self, table):
+        '''
+        For every school in table with no SAT midpoints, set historical_data to the same
+        school in the most recent of self.years that has them, so that School.sat25_data
+        can fall back on it.  Years are loaded newest first, and only while there are
+        still schools left to look up.
+        '''
+        missing = [sch for sch in table if sch.satvrmid is None]
+        for year in sorted(self.years, reverse=True):
+            if not missing:
+                break
+            stillMissing = []
+            for sch in missing:
+                old_data = self.school(year, sch.unitid)
+                if old_data is not None and old_data.satvrmid is not None:
+                    # get older SAT data for this school
+                    sch.historical_data = old_data
+                else:
+                    stillMissing.append(sch)
+            missing = stillMissing
@@ -1,11 +1,20 @@
 '''
 Find all colleges where the cost is lower for higher incomes.
+
+findScrewy() prints them for the schools on the generated pages; scanYears() checks
+every school in one or more years' files for that and the other problems in `rules`,
+and writeReport() saves what it finds as JSON:
+
+    python screwy_costs.py 2016 2022 --json screwy_costs.json
 '''
+import argparse
+import json
 
 import collegeCosts as cc
+import scorecardYears
 
 def findScrewy():
-    rr = cc.readFile()
+    rr = cc.readFile(columns=cc.pipelineColumns)
     r2 = cc.filterRows(rr, satMin=0, satMax=2000)
 
     for r in r2:
@@ -16,5 +25,150 @@ def findScrewy():
                 print(r.unitid, r.shortName(), il, "$", cNow, "<", cPrev)
             cPrev = cNow
 
+
+costColumnNames = ['NPT4' + level + suffix
+                   for suffix in ('_PUB', '_PRIV')
+                   for level in ('', '1', '2', '3', '4', '5')]
+satColumnNames = ['SATVR25', 'SATVRMID', 'SATMT25', 'SATMTMID']
+scanColumns = ['UNITID', 'INSTNM', 'CONTROL'] + costColumnNames + satColumnNames
+
+
+class ColumnData(object):
+    '''
+    The columns of a SchoolTable that the rules look at, each as a plain list
+    (all None if the file does not have the column), plus the names of the missing ones.
+    '''
+    def __init__(self, table):
+        self.length = len(table)
+        self.missing = []
+        self.lists = {}
+        for name in scanColumns:
+            try:
+                self.lists[name] = table.column(name).tolist()
+            except AttributeError:
+                self.missing.append(name)
+                self.lists[name] = [None] * self.length
+        isPublic = [c == 1 for c in self.lists['CONTROL']]
+        # what School.cost(level) reads for each school, by level (None = average)
+        self.costs = {}
+        for level in (None, 1, 2, 3, 4, 5):
+            prefix = 'NPT4' + ('' if level is None else str(level))
+            self.costs[level] = [pub if p else priv for p, pub, priv in zip(
+                isPublic, self.lists[prefix + '_PUB'], self.lists[prefix + '_PRIV'])]
+        self.otherCosts = [priv if p else pub for p, pub, priv in zip(
+                isPublic, self.lists['NPT4_PUB'], self.lists['NPT4_PRIV'])]
+
+    def __getitem__(self, name):
+        return self.lists[name]
+
+
+def costDecreases(data):
+    '''
+    A higher income level pays less than the one below it (as in findScrewy).
+    '''
+    found = []
+    for level in range(2, 6):
+        below = data.costs[level - 1]
+        here = data.costs[level]
+        found.extend((i, {'level': level, 'cost': c, 'level_below_cost': b})
+                     for i, (b, c) in enumerate(zip(below, here))
+                     if b is not None and c is not None and c < b)
+    return found
+
+def negativeCosts(data):
+    '''
+    A net price below zero at any level.
+    '''
+    found = []
+    for level, costs in data.costs.items():
+        found.extend((i, {'level': level, 'cost': c})
+                     for i, c in enumerate(costs) if c is not None and c < 0)
+    return found
+
+def costInOtherColumn(data):
+    '''
+    No average net price in the column for the school's control (public/private),
+    but one in the other column, so School.cost() finds nothing.
+    '''
+    return [(i, {'control': control, 'other_column_cost': other})
+            for i, (control, c, other) in enumerate(zip(data['CONTROL'], data.costs[None],
+                                                        data.otherCosts))
+            if c is None and other is not None]
+
+def sat25AboveMidpoint(data):
+    '''
+    An SAT 25th percentile higher than the midpoint.
+    '''
+    found = []
+    for section in ('VR', 'MT'):
+        found.extend((i, {'section': section, 'sat25': p25, 'satmid': mid})
+                     for i, (p25, mid) in enumerate(zip(data['SAT%s25' % section],
+                                                        data['SAT%sMID' % section]))
+                     if p25 is not None and mid is not None and p25 > mid)
+    return found
+
+rules = {
+    'cost_decreases': costDecreases,
+    'negative_cost': negativeCosts,
+    'cost_in_other_column': costInOtherColumn,
+    'sat25_above_midpoint': sat25AboveMidpoint,
+}
+
+
+def scanTable(table, ruleNames=None):
+    '''
+    Runs the rules (default: all of them) over every school in table.  Returns a dict
+    with the names of any cost or SAT columns the file lacks and, for each rule,
+    a list of findings sorted by unitid.
+    '''
+    if ruleNames is None:
+        ruleNames = list(rules)
+    data = ColumnData(table)
+    unitids = data['UNITID']
+    names = data['INSTNM']
+    out = {'schools': data.length,
+           'missing_columns': data.missing,
+           'findings': {},
+           }
+    for ruleName in ruleNames:
+        findings = []
+        for i, details in rules[ruleName](data):
+            finding = {'unitid': unitids[i], 'instnm': names[i]}
+            finding.update(details)
+            findings.append(finding)
+        findings.sort(key=lambda f: (f['unitid'] is None, f['unitid'] or 0))
+        out['findings'][ruleName] = findings
+    return out
+
+def scanYears(years, ruleNames=None, useCache=True):
+    '''
+    scanTable for each of years, as a dict of year -> results.
+    '''
+    store = scorecardYears.ScorecardYears(years, columns=scanColumns, useCache=useCache)
+    return {year: scanTable(store.table(year), ruleNames) for year in store.years}
+
+def writeReport(fn, results):
+    with open(fn, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1)
+
+
 if __name__ == '__main__':
-    findScrewy()
+    parser = argparse.ArgumentParser(description='Find schools with odd costs or scores.')
+    parser.add_argument('years', nargs='*',
+                        help='scan these years with every rule (default: run findScrewy)')
+    parser.add_argument('--json', help='write the scan results here')
+    parser.add_argument('--rule', action='append', choices=sorted(rules),
+                        help='only run this rule (can be repeated)')
+    args = parser.parse_args()
+    if not args.years:
+        findScrewy()
+    else:
+        results = scanYears(args.years, args.rule)
+        if args.json:
+            writeReport(args.json, results)
+        for year, result in results.items():
+            print(year, result['schools'], 'schools')
+            if result['missing_columns']:
+                print('  missing columns:', ', '.join(result['missing_columns']))
+            for ruleName, findings in result['findings'].items():
+                print('  %-22s %d' % (ruleName, len(findings)))
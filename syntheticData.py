@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:         syntheticData.py
+# Purpose:      Make fake Scorecard files for testing and benchmarks
+#
+# Authors:      Michael Scott Asato Cuthbert
+#
+# Copyright:    Copyright © 2016-23 Michael Scott Asato Cuthbert
+# License:      MIT, see LICENSE file
+#-------------------------------------------------------------------------------
+'''
+Writes college_data_YYYY.csv.gz files that look like the real Scorecard files to
+readFile and the rest of the system -- the same column names for everything the pages
+use, 'NULL' and 'PrivacySuppressed' cells, public and private cost columns, several
+years sharing most of their unitids -- but with made-up schools, so that the real
+(large) files are not needed to measure or try out the code.
+
+    python syntheticData.py --rows 7000 --columns 2000 2016 2022
+
+The same seed always gives the same files.
+'''
+import argparse
+import csv
+import gzip
+import os
+import random
+
+import collegeCosts as cc
+
+# real Scorecard columns that nothing here reads, used (in order) before the numbered filler
+otherColumns = ['OPEID', 'OPEID6', 'CITY', 'ZIP', 'ACCREDAGENCY', 'INSTURL', 'NPCURL',
+                'HCM2', 'MAIN', 'NUMBRANCH', 'HIGHDEG', 'ST_FIPS', 'REGION', 'LOCALE',
+                'LATITUDE', 'LONGITUDE', 'CCBASIC', 'HBCU', 'RELAFFIL', 'ADM_RATE',
+                'SATVR50', 'SATMT50', 'ACTCM75', 'ACTCMMID', 'ACTEN25', 'ACTMT25', 'SAT_AVG',
+                'UGDS', 'UGDS_WHITE', 'UGDS_BLACK', 'UGDS_HISP', 'UGDS_ASIAN', 'PPTUG_EF',
+                'COSTT4_A', 'TUITIONFEE_IN', 'TUITIONFEE_OUT', 'AVGFACSAL', 'PFTFAC',
+                'PCTPELL', 'C150_4', 'RET_FT4', 'PCTFLOAN', 'MD_EARN_WNE_P10', 'GRAD_DEBT_MDN',
+                ]
+
+words = ['University', 'College', 'Institute', 'of', 'Technology', 'Saint', 'California',
+         'State', 'the', 'School', 'Sciences', 'Seminary', 'Campus', 'San Francisco', 'and',
+         'Southern', 'Art', 'Music', 'North', 'Lake', 'Community', 'Theological', 'Design']
+realNames = list(cc.School.knownAbbreviations) + [
+    'Pennsylvania State University-Penn State Erie',
+    'University of North Carolina at Chapel Hill',
+    'Jewish Theological Seminary of America',
+]
+states = [s for s in cc.stateList if s is not None] + ['GU', 'AS', 'MP']
+
+
+def columnNames(numColumns=None):
+    '''
+    The header of a synthetic file: cc.pipelineColumns, then otherColumns, then
+    numbered filler columns, cut or padded to numColumns (never fewer than the
+    pipeline columns).
+    '''
+    names = list(cc.pipelineColumns) + otherColumns
+    if numColumns is None:
+        return names
+    names.extend('EXTRA_%04d' % i for i in range(max(0, numColumns - len(names))))
+    return names[:max(numColumns, len(cc.pipelineColumns))]
+
+
+class SyntheticYear(object):
+    '''
+    Makes the rows of one year's file.  nullRate is the share of 'NULL' cells in
+    columns that are not always filled in; suppressedRate is the share of graduation
+    rates that are 'PrivacySuppressed'.
+    '''
+    def __init__(self, year, rows=7000, numColumns=None, nullRate=0.3, suppressedRate=0.05,
+                 seed=1, churn=0.05):
+        self.year = int(year)
+        self.rows = rows
+        self.header = columnNames(numColumns)
+        self.nullRate = nullRate
+        self.suppressedRate = suppressedRate
+        self.churn = churn  # share of unitids that differ from the common ones
+        self.rnd = random.Random('%s-%d' % (seed, self.year))
+        self.seed = seed
+
+    def unitids(self):
+        '''
+        The common unitids are the same for every year with the same seed and rows;
+        churn of them are replaced by ones only in this year.  Common unitids are below
+        100000 + 7 * rows and each year's own ones are in a block of that size above it,
+        so no two schools ever share a unitid, however many rows there are.
+        '''
+        common = random.Random('%s-unitids' % self.seed)
+        yearOffset = 7 * self.rows * (self.year - 1990)
+        out = []
+        for i in range(self.rows):
+            u = 100000 + 7 * i + common.randint(0, 6)
+            if self.rnd.random() < self.churn:
+                u += yearOffset
+            out.append(u)
+        return out
+
+    def maybe(self, value, rate=None):
+        if self.rnd.random() < (self.nullRate if rate is None else rate):
+            return 'NULL'
+        return value
+
+    def row(self, unitid):
+        rnd = self.rnd
+        control = rnd.choice((1, 1, 2, 2, 2, 3))
+        if rnd.random() < 0.01:
+            name = rnd.choice(realNames)
+        else:
+            name = ' '.join(rnd.choice(words) for unused in range(rnd.randint(2, 7)))
+        cells = {'UNITID': unitid,
+                 'INSTNM': name,
+                 'STABBR': rnd.choice(states),
+                 'PREDDEG': rnd.choice((1, 2, 3, 3, 3, 3, 4)),
+                 'CONTROL': control,
+                 }
+
+        if rnd.random() < (0.6 if self.year < 2020 else 0.4):  # SATs went optional
+            v25 = rnd.randint(200, 720)
+            m25 = rnd.randint(200, 720)
+            cells.update({'SATVR25': self.maybe(v25, .2),
+                          'SATVR75': v25 + rnd.randint(50, 150),
+                          'SATMT25': m25,
+                          'SATMT75': m25 + rnd.randint(50, 150),
+                          'SATVRMID': self.maybe(v25 + 60, .05),
+                          'SATMTMID': m25 + 60,
+                          })
+        cells['ACTCM25'] = self.maybe(rnd.randint(10, 34), .5)
+        cells['ACTCMMID'] = self.maybe(rnd.randint(12, 35))
+        cells['ACTCM75'] = self.maybe(rnd.randint(15, 36))
+
+        gradRate = self.maybe('%.4f' % rnd.random(), .15)
+        if gradRate != 'NULL' and rnd.random() < self.suppressedRate:
+            gradRate = 'PrivacySuppressed'
+        cells['C150_4_POOLED_SUPP'] = gradRate
+        cells['C200_L4_POOLED_SUPP'] = self.maybe('%.4f' % rnd.random(), .5)
+
+        suffix = '_PUB' if control == 1 else '_PRIV'
+        base = rnd.randint(-3000, 60000)
+        for level in ('', '1', '2', '3', '4', '5'):
+            step = 0 if level == '' else int(level)
+            cells['NPT4' + level + suffix] = self.maybe(base + step * rnd.randint(-2000, 8000), .1)
+        return [cells[h] if h in cells else self.filler(h) for h in self.header]
+
+    def filler(self, name):
+        rnd = self.rnd
+        if rnd.random() < self.nullRate or name.startswith('SAT') or name.startswith('NPT4'):
+            return 'NULL'
+        kind = len(name) % 3
+        if kind == 0:
+            return rnd.randint(0, 100000)
+        if kind == 1:
+            return '%.4f' % rnd.random()
+        return rnd.choice(('PrivacySuppressed', 'Town', 'https://example.edu'))
+
+    def write(self, fn):
+        with gzip.open(fn, 'wt', encoding='latin-1', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.header)
+            for unitid in self.unitids():
+                writer.writerow(self.row(unitid))
+
+
+def writeYears(directory, years=('2016', '2022'), rows=7000, numColumns=None, nullRate=0.3,
+               seed=1):
+    '''
+    Writes college_data_YEAR.csv.gz in directory for each year and returns their paths.
+    '''
+    paths = []
+    for year in years:
+        fn = os.path.join(directory, 'college_data_%s.csv.gz' % year)
+        SyntheticYear(year, rows, numColumns, nullRate, seed=seed).write(fn)
+        paths.append(fn)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic Scorecard files.')
+    parser.add_argument('years', nargs='*', default=['2016', '2022'])
+    parser.add_argument('--rows', type=int, default=7000)
+    parser.add_argument('--columns', type=int, default=None,
+                        help='total number of columns (default: only named ones)')
+    parser.add_argument('--null-rate', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--dir', default='.')
+    args = parser.parse_args()
+    for path in writeYears(args.dir, args.years, args.rows, args.columns, args.null_rate,
+                           args.seed):
+        print(path)